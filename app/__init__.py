@@ -21,7 +21,14 @@ from app.core.init_app import (
     register_exceptions,
     register_routers,
 )
+from app.core.audit import audit_log_writer
 from app.core.cache import cache_manager
+from app.core.permission import permission_cache
+from app.controllers.user import last_login_writer
+from app.core.principal import principal_cache
+from app.core.retention import log_retention
+from app.core.rollup import api_rollup_writer
+from app.utils.security import password_hasher
 from app.log import log
 from app.models.system import Log
 from app.models.system import LogType, LogDetailType
@@ -78,6 +85,25 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
             log.warning(f"Cache manager initialization failed: {e}")
             log.info("Application will continue without cache functionality")
 
+        # 同步角色权限版本到 Redis, 使各进程的权限判定缓存以数据库中的版本为准
+        await permission_cache.publish_versions()
+        log.info("Permission versions published")
+
+        # 订阅身份快照失效通知
+        await principal_cache.start()
+
+        # 启动最后登录时间的定时批量写回
+        await last_login_writer.start()
+
+        # 启动审计日志批量写入
+        await audit_log_writer.start()
+
+        # 启动API指标汇总写入
+        await api_rollup_writer.start()
+
+        # 启动日志保留清理
+        await log_retention.start()
+
         # 执行缓存预热 - 临时禁用以避免Redis连接错误
         try:
             preload_result = await cache_manager.preload_cache()
@@ -101,6 +127,13 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
     # 关闭阶段
     finally:
         try:
+            await principal_cache.stop()
+            await last_login_writer.stop()
+            await audit_log_writer.stop()
+            await api_rollup_writer.stop()
+            await log_retention.stop()
+            password_hasher.shutdown()
+
             end_time = datetime.now()
             runtime = (end_time - start_time).total_seconds() / 60
 
@@ -1,14 +1,16 @@
 from datetime import datetime, timedelta, UTC
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 
 from app.log import log
 from app.api.v1.utils import insert_log
 from app.controllers.user import user_controller
-from app.core.ctx import CTX_USER_ID
 from app.core.dependency import DependAuth, check_token
+from app.core.permission import permission_cache
+from app.core.principal import Principal
+from app.core.ratelimit import error_ip_limiter, get_client_ip, login_ip_limiter, login_user_limiter
 from app.models.system import LogDetailType, LogType
-from app.models.system import User, Role, Button, StatusType
+from app.models.system import User, StatusType
 from app.schemas.base import Fail, Success
 from app.schemas.login import CredentialsSchema, JWTOut, JWTPayload
 from app.configs import APP_SETTINGS
@@ -17,8 +19,26 @@ from app.utils.security import create_access_token
 router = APIRouter()
 
 
+async def _embed_permissions(payload: JWTPayload, user_obj: User) -> None:
+    """开启 JWT_EMBED_PERMISSIONS 时, 在访问令牌中写入角色编码及权限戳"""
+    if not APP_SETTINGS.JWT_EMBED_PERMISSIONS:
+        return
+
+    # 先取权限戳再取角色编码, 期间角色若发生变化则权限戳已轮换, 令牌会回退到数据库校验
+    stamp = await permission_cache.get_permission_stamp(user_obj.id)
+    if stamp is None:
+        return
+
+    payload.data["roles"] = await permission_cache.get_user_role_codes(user_obj.id)
+    payload.data["permVersion"] = stamp
+
+
 @router.post("/login", summary="登录")
-async def _(credentials: CredentialsSchema):
+async def _(credentials: CredentialsSchema, request: Request):
+    # 先限流再验证账号, 被拒绝的请求不产生密码哈希及数据库开销
+    await login_ip_limiter.check(get_client_ip(request))
+    await login_user_limiter.check(credentials.user_name.lower())
+
     user_obj: User | None = await user_controller.authenticate(credentials)  # 账号验证, 失败则触发异常返回请求错误
 
     await user_controller.update_last_login(user_obj.id)
@@ -32,6 +52,7 @@ async def _(credentials: CredentialsSchema):
     refresh_token_payload = payload.model_copy(deep=True)
     refresh_token_payload.data["tokenType"] = "refreshToken"
     refresh_token_payload.exp += timedelta(minutes=APP_SETTINGS.JWT_REFRESH_TOKEN_EXPIRE_MINUTES)
+    await _embed_permissions(access_token_payload, user_obj)
     data = JWTOut(
         access_token=create_access_token(data=access_token_payload),
         refresh_token=create_access_token(data=refresh_token_payload),
@@ -71,6 +92,7 @@ async def _(jwt_token: JWTOut):
     refresh_token_payload = payload.model_copy(deep=True)
     refresh_token_payload.data["tokenType"] = "refreshToken"
     refresh_token_payload.exp += timedelta(minutes=APP_SETTINGS.JWT_REFRESH_TOKEN_EXPIRE_MINUTES)
+    await _embed_permissions(access_token_payload, user_obj)
 
     data = JWTOut(
         access_token=create_access_token(data=access_token_payload),
@@ -82,33 +104,20 @@ async def _(jwt_token: JWTOut):
     return Success(data=data.model_dump(by_alias=True))
 
 
-@router.get("/user-info", summary="查看用户信息", dependencies=[DependAuth])
-async def _():
-    user_id = CTX_USER_ID.get()
-    user_obj: User = await user_controller.get(id=user_id)
-    await user_obj.fetch_related("by_user_roles", "by_user_roles__by_role_buttons")
+@router.get("/user-info", summary="查看用户信息")
+async def _(current_user: Principal = DependAuth):
+    user_obj: User = await user_controller.get(id=current_user.id)
     data = await user_obj.to_dict(exclude_fields=["id", "password", "create_time", "update_time"])
-
-    user_roles: list[Role] = await user_obj.by_user_roles
-    user_role_codes = [user_role.role_code for user_role in user_roles]
-
-    user_role_button_codes = (
-        [b.button_code for b in await Button.all()]
-        if "R_SUPER" in user_role_codes
-        else [b.button_code for user_role in user_roles for b in user_role.by_role_buttons]
-    )
-
-    user_role_button_codes = list(set(user_role_button_codes))
-
-    data.update({"userId": user_id, "roles": user_role_codes, "buttons": user_role_button_codes})
+    data.update({"userId": current_user.id, "roles": current_user.role_codes, "buttons": current_user.button_codes})
     await insert_log(
         log_type=LogType.UserLog, log_detail_type=LogDetailType.UserLoginGetUserInfo, by_user_id=user_obj.id
     )
     return Success(data=data)
 
 
-@router.get("/error", summary="自定义后端错误")  # todo 使用限流器, 每秒最多一次
-async def _(code: str, msg: str):
+@router.get("/error", summary="自定义后端错误")
+async def _(code: str, msg: str, request: Request):
+    await error_ip_limiter.check(get_client_ip(request))
     if code == "9999":
         return Success(code="4040", msg="accessToken已过期")
 
@@ -6,9 +6,13 @@
 from typing import Any
 from fastapi import APIRouter, HTTPException, Depends
 
+from app.core.archive import log_archive
+from app.core.audit import api_log_sampler, audit_log_writer
+from app.core.rollup import api_rollup_writer
 from app.core.cache import cache_manager
-from app.core.dependency import AuthControl
-from app.models.system import User
+from app.core.dependency import AuthControl, token_cache
+from app.core.principal import Principal, principal_cache
+from app.utils.security import password_hasher
 from app.log import log
 
 router = APIRouter(prefix="/cache", tags=["缓存管理"])
@@ -29,7 +33,7 @@ async def cache_health_check() -> dict[str, Any]:
 
 
 @router.get("/stats", summary="缓存统计信息")
-async def cache_stats(current_user: User = Depends(AuthControl.is_authed)) -> dict[str, Any]:
+async def cache_stats(current_user: Principal = Depends(AuthControl.is_authed)) -> dict[str, Any]:
     """
     获取缓存统计信息
     包括命中率、请求次数、平均响应时间等
@@ -37,6 +41,13 @@ async def cache_stats(current_user: User = Depends(AuthControl.is_authed)) -> di
     try:
         stats = cache_manager.stats.copy()
         stats["hit_rate_percent"] = cache_manager.get_hit_rate()
+        stats["token_cache"] = token_cache.get_stats()
+        stats["principal_cache"] = principal_cache.get_stats()
+        stats["password_hasher"] = password_hasher.get_stats()
+        stats["audit_log"] = audit_log_writer.get_stats()
+        stats["api_log_sampling"] = api_log_sampler.get_stats()
+        stats["log_archive"] = log_archive.get_stats()
+        stats["api_rollup"] = api_rollup_writer.get_stats()
 
         return {"code": 200, "message": "Cache statistics retrieved successfully", "data": stats}
     except Exception as e:
@@ -45,7 +56,7 @@ async def cache_stats(current_user: User = Depends(AuthControl.is_authed)) -> di
 
 
 @router.post("/preload", summary="缓存预热")
-async def cache_preload(current_user: User = Depends(AuthControl.is_authed)) -> dict[str, Any]:
+async def cache_preload(current_user: Principal = Depends(AuthControl.is_authed)) -> dict[str, Any]:
     """
     执行缓存预热操作
     预加载常用数据到Redis缓存中
@@ -69,7 +80,7 @@ async def cache_preload(current_user: User = Depends(AuthControl.is_authed)) ->
 
 @router.delete("/clear", summary="清理缓存")
 async def cache_clear(
-    pattern: str = "fastapi-cache:*", current_user: User = Depends(AuthControl.is_authed)
+    pattern: str = "fastapi-cache:*", current_user: Principal = Depends(AuthControl.is_authed)
 ) -> dict[str, Any]:
     """
     清理缓存数据
@@ -95,7 +106,7 @@ async def cache_clear(
 
 
 @router.get("/info", summary="缓存详细信息")
-async def cache_info(current_user: User = Depends(AuthControl.is_authed)) -> dict[str, Any]:
+async def cache_info(current_user: Principal = Depends(AuthControl.is_authed)) -> dict[str, Any]:
     """
     获取Redis缓存详细信息
     包括内存使用、连接数、配置信息等
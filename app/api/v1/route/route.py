@@ -1,9 +1,10 @@
 from fastapi import APIRouter
 
 from app.controllers.menu import menu_controller
-from app.core.ctx import CTX_USER_ID
 from app.core.dependency import DependAuth
-from app.models.system import Menu, Role, User, IconType
+from app.core.permission import permission_registry
+from app.core.principal import Principal, principal_cache
+from app.models.system import Menu, IconType
 from app.schemas.base import Success
 
 router = APIRouter()
@@ -85,44 +86,27 @@ async def _():
     return Success(data=data)
 
 
-@router.get("/user-routes", summary="查看用户路由菜单", dependencies=[DependAuth])
-async def _():
+@router.get("/user-routes", summary="查看用户路由菜单")
+async def _(current_user: Principal = DependAuth):
     """
     查看用户路由菜单, 超级管理员返回所有菜单
     :return:
     """
-    user_id = CTX_USER_ID.get()
-    user_obj = await User.get(id=user_id).prefetch_related(
-        "by_user_roles",
-        "by_user_roles__by_role_menus",
-        "by_user_roles__by_role_menus__active_menu",
-    )
-    user_roles: list[Role] = await user_obj.by_user_roles
-
-    role_ids = [r.id for r in user_roles]
-    roles_with_home = await Role.filter(id__in=role_ids).select_related("by_role_home")
-    role_home_by_id = {r.id: r.by_role_home for r in roles_with_home}
-
-    is_super = False
-    role_home: str = "home"
-    for user_role in user_roles:
-        if user_role.role_code == "R_SUPER":
-            is_super = True
-
-        role_home_obj = role_home_by_id.get(user_role.id)
-        if role_home_obj:
-            role_home = role_home_obj.route_name
-            # break  # 注释掉, 取最后一个角色的首页
-
-    if is_super:
+    # 首页取最后一个配置了首页的角色
+    role_home: str = current_user.home
+
+    if current_user.is_super:
         role_routes: list[Menu] = await Menu.filter(constant=False).prefetch_related("active_menu")
     else:
-        role_routes_by_id: dict[int, Menu] = {}
-        for user_role in user_roles:
-            user_role_routes: list[Menu] = await user_role.by_role_menus
-            for user_role_route in user_role_routes:
-                if not user_role_route.constant or user_role_route.hide_in_menu:
-                    role_routes_by_id[user_role_route.id] = user_role_route
+        # 由身份快照中的菜单位图解码出菜单id, 一次查询取回全部菜单
+        current_user = await principal_cache.refresh(current_user)
+        menu_ids = permission_registry.get_menu_ids(current_user.grants)
+        user_role_routes: list[Menu] = await Menu.filter(id__in=menu_ids).prefetch_related("active_menu")
+        role_routes_by_id: dict[int, Menu] = {
+            user_role_route.id: user_role_route
+            for user_role_route in user_role_routes
+            if not user_role_route.constant or user_role_route.hide_in_menu
+        }
 
         pending_parent_ids = {m.parent_id for m in role_routes_by_id.values() if m.parent_id}
         while pending_parent_ids:
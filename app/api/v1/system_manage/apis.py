@@ -2,10 +2,11 @@ from fastapi import APIRouter, Query
 from tortoise.expressions import Q
 
 from app.api.v1.utils import refresh_api_list, insert_log, generate_tags_recursive_list
-from app.controllers import user_controller
 from app.controllers.api import api_controller
-from app.core.ctx import CTX_USER_ID
-from app.models.system import Api, Role
+from app.core.dependency import DependPermission
+from app.core.permission import api_index, permission_cache, permission_registry
+from app.core.principal import Principal, principal_cache
+from app.models.system import Api
 from app.models.system import LogType, LogDetailType
 from app.schemas.apis import ApiCreate, ApiUpdate, ApiSearch
 from app.schemas.base import Success, SuccessExtra
@@ -14,7 +15,7 @@ router = APIRouter()
 
 
 @router.post("/apis/all/", summary="查看API列表")
-async def _(obj_in: ApiSearch):
+async def _(obj_in: ApiSearch, current_user: Principal = DependPermission):
     q = Q()
     if obj_in.api_path:
         q &= Q(api_path__contains=obj_in.api_path)
@@ -26,35 +27,24 @@ async def _(obj_in: ApiSearch):
     if obj_in.status_type:
         q &= Q(status_type=obj_in.status_type)
 
-    user_id = CTX_USER_ID.get()
-    user_obj = await user_controller.get(id=user_id)
-    await user_obj.fetch_related("by_user_roles")
-    user_role_objs: list[Role] = await user_obj.by_user_roles
-    user_role_codes = [role_obj.role_code for role_obj in user_role_objs]
-    if "R_SUPER" in user_role_codes:
-        total, api_objs = await api_controller.list(
-            page=obj_in.current, page_size=obj_in.size, search=q, order=["tags", "id"]
-        )
-    else:
-        api_objs: list[Api] = []
-        for role_obj in user_role_objs:
-            await role_obj.fetch_related("by_role_apis")
-            api_objs.extend([api_obj for api_obj in await role_obj.by_role_apis.filter(q)])
-
-        unique_apis = list(set(api_objs))
-        sorted_menus = sorted(unique_apis, key=lambda x: x.id)
-        # 实现分页
-        start = (obj_in.current - 1) * obj_in.size
-        end = start + obj_in.size
-        api_objs = sorted_menus[start:end]
-        total = len(sorted_menus)
+    if not current_user.is_super:
+        # 由身份快照中的授权位图解码出 API id, 由数据库完成过滤与分页; 权限判定可能已重建注册表, 先按当前槽位重新解码
+        current_user = await principal_cache.refresh(current_user)
+        q &= Q(id__in=permission_registry.get_api_ids(current_user.grants))
+    # tags 为 JSON 列, 无法作为游标比较, 游标模式按 id 排序
+    order = ["tags", "id"] if current_user.is_super and obj_in.cursor is None else ["id"]
+    total, api_objs = await api_controller.list(
+        page=obj_in.current, page_size=obj_in.size, search=q, order=order, cursor=obj_in.cursor
+    )
 
     records = []
     for obj in api_objs:
         data = await obj.to_dict(exclude_fields=["create_time", "update_time"])
         records.append(data)
     data = {"records": records}
-    await insert_log(log_type=LogType.UserLog, log_detail_type=LogDetailType.ApiGetList, by_user_id=user_obj.id)
+    if obj_in.cursor is not None:
+        data["nextCursor"] = api_controller.next_cursor(api_objs, obj_in.size, order)
+    await insert_log(log_type=LogType.UserLog, log_detail_type=LogDetailType.ApiGetList, by_user_id=current_user.id)
     return SuccessExtra(data=data, total=total, current=obj_in.current, size=obj_in.size)
 
 
@@ -104,6 +94,8 @@ async def _(api_in: ApiCreate):
     if isinstance(api_in.tags, str):
         api_in.tags = api_in.tags.split("|")
     new_api = await api_controller.create(obj_in=api_in)
+    api_index.invalidate()
+    await permission_cache.bump_role_versions()
     await insert_log(log_type=LogType.UserLog, log_detail_type=LogDetailType.ApiCreateOne, by_user_id=0)
     return Success(msg="Created Successfully", data={"created_id": new_api.id})
 
@@ -113,6 +105,8 @@ async def _(api_id: int, api_in: ApiUpdate):
     if isinstance(api_in.tags, str):
         api_in.tags = api_in.tags.split("|")
     await api_controller.update(id=api_id, obj_in=api_in)
+    api_index.invalidate()
+    await permission_cache.bump_role_versions()
     await insert_log(log_type=LogType.UserLog, log_detail_type=LogDetailType.ApiUpdateOne, by_user_id=0)
     return Success(msg="Update Successfully", data={"updated_id": api_id})
 
@@ -120,6 +114,8 @@ async def _(api_id: int, api_in: ApiUpdate):
 @router.delete("/apis/{api_id}", summary="删除API")
 async def _(api_id: int):
     await api_controller.remove(id=api_id)
+    api_index.invalidate()
+    await permission_cache.bump_role_versions()
     await insert_log(log_type=LogType.UserLog, log_detail_type=LogDetailType.ApiDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_id": api_id})
 
@@ -132,6 +128,8 @@ async def _(ids: str = Query(..., description="API ID列表, 用逗号隔开")):
         api_obj = await Api.get(id=int(api_id))
         await api_obj.delete()
         deleted_ids.append(int(api_id))
+    api_index.invalidate()
+    await permission_cache.bump_role_versions()
     await insert_log(log_type=LogType.UserLog, log_detail_type=LogDetailType.ApiBatchDelete, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_ids": deleted_ids})
 
@@ -1,21 +1,25 @@
-import json
+from datetime import timedelta
 
 from fastapi import APIRouter, Query
+from tortoise import timezone
 from tortoise.expressions import Q
 
-from app.controllers import user_controller
 from app.controllers.log import log_controller
-from app.core.ctx import CTX_USER_ID
+from app.core.archive import log_archive
+from app.core.crud import CountStrategy, Total, prefix_filter
+from app.core.dependency import DependPermission
+from app.core.principal import Principal
+from app.core.rollup import summarize_rollups
 from app.models.system import LogType
-from app.models.system import User, Role, Log, APILog
+from app.models.system import User, Log
 from app.schemas.base import Success, SuccessExtra, Fail
-from app.schemas.logs import LogUpdate, LogSearch
+from app.schemas.logs import LogUpdate, LogSearch, LogStatsSearch
 
 router = APIRouter()
 
 
 @router.post("/logs/all/", summary="查看日志列表")
-async def _(log_in: LogSearch):
+async def _(log_in: LogSearch, current_user: Principal = DependPermission):
     if log_in.log_type is None:
         log_in.log_type = LogType.ApiLog
 
@@ -35,22 +39,26 @@ async def _(log_in: LogSearch):
             return Success(msg="用户不存在", code=2000)
     if log_in.log_detail_type:
         q &= Q(log_detail_type=log_in.log_detail_type)
+    # 路由模板及请求方法为等值匹配, 请求路径为前缀匹配, 均可使用 api_logs 上的索引
+    if log_in.route_path:
+        q &= Q(api_log__route_path=log_in.route_path)
+    if log_in.request_method:
+        log_in.request_method = log_in.request_method.upper()
+        q &= Q(api_log__request_method=log_in.request_method)
     if log_in.request_path:
-        q &= Q(api_log__request_path__contains=log_in.request_path)
+        q &= prefix_filter("api_log__request_path", log_in.request_path)
     if log_in.response_code:
         q &= Q(api_log__response_code=log_in.response_code)
     if log_in.time_range:
         if len(log_in.time_range) != 2:
             return Success(msg="时间范围只能为两个值", code=2000)
-        q &= Q(create_time__gt=log_in.time_range[0], create_time__lt=log_in.time_range[1])
+        # 时间范围为 [起始, 截止), 与归档查询一致
+        q &= Q(create_time__gte=log_in.time_range[0], create_time__lt=log_in.time_range[1])
 
     if log_in.x_request_id:
         q &= Q(x_request_id=log_in.x_request_id)
 
-    user_id = CTX_USER_ID.get()
-    user_obj = await user_controller.get(id=user_id)
-    user_role_objs: list[Role] = await user_obj.by_user_roles
-    user_role_codes = [role_obj.role_code for role_obj in user_role_objs]
+    user_role_codes = current_user.role_codes
 
     if "R_ADMIN" in user_role_codes and log_in.log_type not in [
         LogType.ApiLog,
@@ -62,33 +70,69 @@ async def _(log_in: LogSearch):
     ):  # 非超级管理员和管理员只能查看API日志
         return Fail(msg="Permission Denied")
 
-    total, log_objs = await log_controller.list(page=log_in.current, page_size=log_in.size, search=q, order=["-id"])
-    records = []
-    for obj in log_objs:
-        await obj.fetch_related("api_log", "by_user")
-        api_log: APILog = obj.api_log
-        by_user: User = obj.by_user
-        record = await obj.to_dict(exclude_fields=["by_user_id", "api_log_id"])
-        if log_in.log_type == LogType.ApiLog:
-            api_log_dict = await api_log.to_dict(exclude_fields=[])
-            api_log_dict["requestParams"] = json.dumps(api_log_dict["requestParams"], ensure_ascii=False)
-            api_log_dict["responseData"] = json.dumps(api_log_dict["responseData"], ensure_ascii=False)
-            record.update(api_log_dict)
-            record = {"logUser": "Request", **record}
-        elif log_in.log_type == LogType.SystemLog:
-            record["logUser"] = "System"
+    total, records, last_log_id = await log_controller.list_records(
+        page=log_in.current, page_size=log_in.size, search=q, log_type=log_in.log_type, cursor=log_in.cursor
+    )
+
+    # 查询范围早于热数据窗口或按 x_request_id 查找时, 继续读取归档分段, 归档记录均早于数据库中的记录
+    if log_in.log_type == LogType.ApiLog and (
+        log_in.x_request_id or (log_in.time_range and log_archive.covers(log_in.time_range[0]))
+    ):
+        if log_in.cursor is None:
+            # 归档的偏移量由数据库中的匹配数推算, capped / estimated / cached 的总数可能不准, 需重新精确计数
+            if log_controller.count_strategy not in (CountStrategy.exact, CountStrategy.window):
+                total = await log_controller.count(Log.filter(q), CountStrategy.exact)
+            offset, before_log_id = max((log_in.current - 1) * log_in.size - total, 0), None
         else:
-            if by_user:
-                record["byUser"] = str(by_user.id)
-                record["byUserInfo"] = await by_user.to_dict(include_fields=["id", "nick_name"])
-            else:
-                record["byUser"] = None
+            offset, before_log_id = 0, last_log_id or log_controller.cursor_log_id(log_in.cursor)
+        archived_total, archived_rows = await log_archive.search(
+            time_range=log_in.time_range,
+            request_path=log_in.request_path,
+            route_path=log_in.route_path,
+            request_method=log_in.request_method,
+            response_code=log_in.response_code,
+            x_request_id=log_in.x_request_id,
+            log_detail_type=log_in.log_detail_type,
+            by_user_id=int(log_in.by_user) if log_in.by_user else None,
+            before_log_id=before_log_id,
+            offset=offset,
+            limit=log_in.size - len(records),
+            count_strategy=log_controller.count_strategy,
+            counted=total,
+        )
+        records.extend(log_archive.to_record(row) for row in archived_rows)
+        total = Total(total + archived_total, exact=total.exact and archived_total.exact)
+        if archived_rows:
+            last_log_id = archived_rows[-1]["log_id"] or 0
 
-        records.append(record)
     data = {"records": records}
+    if log_in.cursor is not None:
+        # 当前页不满时已无更多数据
+        data["nextCursor"] = log_controller.make_cursor(last_log_id) if len(records) == log_in.size else None
     return SuccessExtra(data=data, total=total, current=log_in.current, size=log_in.size)
 
 
+@router.post("/logs/stats/", summary="查看API指标统计")
+async def _(stats_in: LogStatsSearch):
+    if stats_in.time_range:
+        if len(stats_in.time_range) != 2:
+            return Success(msg="时间范围只能为两个值", code=2000)
+        start, end = stats_in.time_range
+    else:
+        end = timezone.now()
+        start = end - timedelta(hours=1)
+
+    records = await summarize_rollups(
+        start=start,
+        end=end,
+        route_path=stats_in.route_path,
+        request_method=stats_in.request_method.upper() if stats_in.request_method else None,
+        group_by=stats_in.group_by,
+        interval=stats_in.interval,
+    )
+    return Success(data={"records": records})
+
+
 @router.get("/logs/{log_id}", summary="查看日志")
 async def _(log_id: int):
     log_obj = await log_controller.get(id=log_id)
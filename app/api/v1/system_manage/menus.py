@@ -3,6 +3,7 @@ from tortoise.functions import Count
 
 from app.api.v1.utils import insert_log
 from app.controllers.menu import menu_controller
+from app.core.permission import permission_cache
 from app.models.system import LogType, LogDetailType, IconType
 from app.models.system import Menu
 from app.schemas.base import Success, SuccessExtra, CommonIds
@@ -75,6 +76,7 @@ async def _(menu_in: MenuCreate):
         menu_in.active_menu = await menu_controller.get(menu_name=menu_in.active_menu)
 
     new_menu = await menu_controller.create(obj_in=menu_in, exclude={"buttons"})
+    await permission_cache.bump_role_versions()
     if new_menu and menu_in.by_menu_buttons:
         await menu_controller.update_buttons_by_code(new_menu, menu_in.by_menu_buttons)
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.MenuCreateOne, by_user_id=0)
@@ -93,6 +95,7 @@ async def _(menu_id: int, menu_in: MenuUpdate):
 @router.delete("/menus/{menu_id}", summary="删除菜单")
 async def _(menu_id: int):
     await menu_controller.remove(id=menu_id)
+    await permission_cache.bump_role_versions()
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.MenuDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_id": menu_id})
 
@@ -104,6 +107,7 @@ async def _(obj_in: CommonIds):
         # 使用批量删除优化性能
         await menu_controller.model.filter(id__in=obj_in.ids).delete()
         deleted_ids = obj_in.ids
+        await permission_cache.bump_role_versions()
 
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.MenuBatchDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_ids": deleted_ids})
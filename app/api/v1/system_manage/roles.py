@@ -4,7 +4,8 @@ from tortoise.expressions import Q
 from app.api.v1.utils import insert_log
 from app.controllers import role_controller
 from app.controllers.menu import menu_controller
-from app.models.system import Api, Button, Role
+from app.core.permission import permission_cache
+from app.models.system import Api, Button, Menu, Role
 from app.models.system import LogType, LogDetailType
 from app.schemas.base import Success, SuccessExtra, CommonIds
 from app.schemas.roles import RoleCreate, RoleUpdate, RoleUpdateAuthrization
@@ -50,6 +51,7 @@ async def _(role_in: RoleCreate):
         return Success(code="4090", msg="The role with this code already exists in the system.")
 
     new_user = await role_controller.create(obj_in=role_in)
+    await permission_cache.bump_role_versions([new_user.id])
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleCreateOne, by_user_id=0)
     return Success(msg="Created Successfully", data={"created_id": new_user.id})
 
@@ -57,6 +59,8 @@ async def _(role_in: RoleCreate):
 @router.patch("/roles/{role_id}", summary="更新角色")
 async def _(role_id: int, role_in: RoleUpdate):
     await role_controller.update(id=role_id, obj_in=role_in)
+    await permission_cache.bump_role_versions([role_id])
+    await permission_cache.clear_user_roles()
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleUpdateOne, by_user_id=0)
     return Success(msg="Updated Successfully", data={"updated_id": role_id})
 
@@ -64,6 +68,8 @@ async def _(role_id: int, role_in: RoleUpdate):
 @router.delete("/roles/{role_id}", summary="删除角色")
 async def _(role_id: int):
     await role_controller.remove(id=role_id)
+    await permission_cache.publish_versions()
+    await permission_cache.clear_user_roles()
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_id": role_id})
 
@@ -75,7 +81,9 @@ async def _(obj_in: CommonIds):
         # 使用批量删除优化性能
         await Role.filter(id__in=obj_in.ids).delete()
         deleted_ids = obj_in.ids
-    
+        await permission_cache.publish_versions()
+        await permission_cache.clear_user_roles()
+
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleBatchDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_ids": deleted_ids})
 
@@ -124,6 +132,7 @@ async def _(role_id: int, role_in: RoleUpdateAuthrization):
             await role_obj.by_role_menus.add(*all_menus)
         else:
             await role_obj.by_role_menus.clear()  # 去除所有角色菜单
+        await permission_cache.bump_role_versions([role_id])
 
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleUpdateMenus, by_user_id=0)
     return Success(
@@ -154,6 +163,7 @@ async def _(role_id: int, role_in: RoleUpdateAuthrization):
             # 批量查询按钮，一次性添加
             buttons = await Button.filter(id__in=role_in.by_role_button_ids)
             await role_obj.by_role_buttons.add(*buttons)
+        await permission_cache.bump_role_versions([role_id])
 
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleUpdateButtons, by_user_id=0)
     return Success(msg="Updated Successfully", data={"by_role_button_ids": role_in.by_role_button_ids})
@@ -181,6 +191,7 @@ async def _(role_id: int, role_in: RoleUpdateAuthrization):
             # 批量查询API，一次性添加
             apis = await Api.filter(id__in=role_in.by_role_api_ids)
             await role_obj.by_role_apis.add(*apis)
+        await permission_cache.bump_role_versions([role_id])
 
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.RoleUpdateApis, by_user_id=0)
     return Success(msg="Updated Successfully", data={"by_role_api_ids": role_in.by_role_api_ids})
@@ -3,6 +3,7 @@ from tortoise.expressions import Q
 
 from app.api.v1.utils import insert_log
 from app.controllers.user import user_controller
+from app.core.permission import permission_cache
 from app.models.system import LogType, LogDetailType
 from app.schemas.base import Success, SuccessExtra, CommonIds
 from app.schemas.users import UserCreate, UserUpdate, UserSearch
@@ -20,6 +21,8 @@ async def _(obj_in: UserSearch):
         record.update({"byUserRoleCodeList": user_role_code_list})
         records.append(record)
     data = {"records": records}
+    if obj_in.cursor is not None:
+        data["nextCursor"] = user_controller.next_cursor(user_objs, obj_in.size, user_controller.list_order)
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.UserGetList, by_user_id=0)
     return SuccessExtra(data=data, total=total, current=obj_in.current, size=obj_in.size)
 
@@ -61,6 +64,7 @@ async def _(user_id: int, user_in: UserUpdate):
 @router.delete("/users/{user_id}", summary="删除用户")
 async def _(user_id: int):
     await user_controller.remove(id=user_id)
+    await permission_cache.invalidate_users([user_id])
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.UserDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_id": user_id})
 
@@ -72,6 +76,7 @@ async def _(obj_in: CommonIds):
         # 使用批量删除优化性能
         await user_controller.model.filter(id__in=obj_in.ids).delete()
         deleted_ids = obj_in.ids
+        await permission_cache.invalidate_users(deleted_ids)
 
     await insert_log(log_type=LogType.AdminLog, log_detail_type=LogDetailType.UserBatchDeleteOne, by_user_id=0)
     return Success(msg="Deleted Successfully", data={"deleted_ids": deleted_ids})
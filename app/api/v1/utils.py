@@ -1,8 +1,10 @@
 from fastapi.routing import APIRoute
 from loguru import logger
 
+from app.core.audit import audit_log_writer
 from app.core.ctx import CTX_USER_ID, CTX_X_REQUEST_ID
-from app.models.system import Api, Log
+from app.core.permission import api_index, permission_cache
+from app.models.system import Api
 from app.models.system import LogType, LogDetailType
 
 
@@ -25,6 +27,9 @@ async def refresh_api_list():
         tags = list(route.tags)
         await Api.update_or_create(api_path=api_path, api_method=api_method, defaults=dict(summary=summary, tags=tags))
 
+    await api_index.reload()
+    await permission_cache.bump_role_versions()
+
 
 async def generate_tags_recursive_list():
     from app import app
@@ -54,15 +59,21 @@ async def generate_tags_recursive_list():
 
 async def insert_log(log_type: LogType, log_detail_type: LogDetailType, by_user_id: int | None = None):
     """
-    插入日志
+    插入日志, 加入审计日志队列后由后台批量写入, 不在请求链路中执行 INSERT
     :param log_type:
     :param log_detail_type:
     :param by_user_id: 0为从上下文获取当前用户id, 需要请求携带token
     :return:
     """
+    # 用户id及请求id在入队时从上下文取得, 写入时上下文已不存在
     if by_user_id == 0 and (by_user_id := CTX_USER_ID.get()) == 0:
         by_user_id = None
 
-    await Log.create(
-        log_type=log_type, log_detail_type=log_detail_type, by_user_id=by_user_id, x_request_id=CTX_X_REQUEST_ID.get()
+    await audit_log_writer.add_log(
+        {
+            "log_type": log_type,
+            "log_detail_type": log_detail_type,
+            "by_user_id": by_user_id,
+            "x_request_id": CTX_X_REQUEST_ID.get(),
+        }
     )
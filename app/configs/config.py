@@ -32,6 +32,70 @@ validators = [
     Validator("JWT_ALGORITHM", must_exist=True, is_type_of=str, is_in=["HS256", "HS384", "HS512"], env="default"),
     Validator("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", must_exist=True, is_type_of=int, gte=1, env="default"),
     Validator("JWT_REFRESH_TOKEN_EXPIRE_MINUTES", must_exist=True, is_type_of=int, gte=1, env="default"),
+    Validator("JWT_EMBED_PERMISSIONS", default=False, is_type_of=bool),
+    Validator("TOKEN_CACHE_SIZE", default=4096, is_type_of=int, gte=0),
+    Validator("PRINCIPAL_CACHE_TTL", default=60, is_type_of=int, gte=0),
+    # 密码哈希执行器配置
+    Validator("PASSWORD_HASH_EXECUTOR", default="thread", is_type_of=str, is_in=["thread", "process"]),
+    Validator("PASSWORD_HASH_WORKERS", default=0, is_type_of=int, gte=0),
+    Validator("PASSWORD_HASH_QUEUE_SIZE", default=64, is_type_of=int, gte=0),
+    Validator("LAST_LOGIN_FLUSH_INTERVAL", default=10, is_type_of=int, gte=1),
+    # 审计日志批量写入配置
+    Validator("AUDIT_LOG_FLUSH_INTERVAL_MS", default=200, is_type_of=int, gte=1),
+    Validator("AUDIT_LOG_BATCH_SIZE", default=500, is_type_of=int, gte=1),
+    Validator("AUDIT_LOG_QUEUE_SIZE", default=10000, is_type_of=int, gte=1),
+    Validator(
+        "AUDIT_LOG_OVERFLOW_POLICY",
+        default="drop_new",
+        is_type_of=str,
+        is_in=["drop_new", "drop_oldest", "block", "spool"],
+    ),
+    Validator("AUDIT_LOG_SPOOL_ROOT", default="logs/audit_spool", is_type_of=str),
+    Validator("AUDIT_LOG_SPOOL_MAX_MB", default=1024, is_type_of=int, gte=0),
+    # API 日志采样配置
+    Validator("API_LOG_SAMPLE_RATES", default={}, is_type_of=dict),
+    Validator("API_LOG_SAMPLE_DEFAULT_RATE", default=1.0, is_type_of=(int, float), gte=0, lte=1),
+    Validator("API_LOG_SLOW_THRESHOLD_MS", default=1000, is_type_of=int, gte=0),
+    # API指标汇总配置
+    Validator("API_ROLLUP_ENABLED", default=True, is_type_of=bool),
+    Validator("API_ROLLUP_FLUSH_INTERVAL", default=10, is_type_of=(int, float), gt=0),
+    Validator("API_ROLLUP_RETENTION_DAYS", default=0, is_type_of=int, gte=0),
+    # 列表总数计算方式
+    Validator("LIST_COUNT_STRATEGIES", default={}, is_type_of=dict),
+    Validator("LIST_COUNT_CAP", default=10000, is_type_of=int, gte=1),
+    Validator("LIST_COUNT_CACHE_TTL", default=30, is_type_of=int, gte=1),
+    # 日志脱敏配置
+    Validator(
+        "LOG_REDACT_KEYS",
+        default=[
+            "password",
+            "token",
+            "accessToken",
+            "access_token",
+            "refreshToken",
+            "refresh_token",
+            "authorization",
+            "cookie",
+        ],
+        is_type_of=list,
+    ),
+    Validator("LOG_REDACT_MAX_DEPTH", default=10, is_type_of=int, gte=1),
+    Validator("LOG_BODY_MAX_BYTES", default=32 * 1024, is_type_of=int, gte=0),
+    # 日志保留配置
+    Validator("LOG_RETENTION_DAYS", default={}, is_type_of=dict),
+    Validator("LOG_RETENTION_INTERVAL_HOURS", default=6, is_type_of=(int, float), gt=0),
+    Validator("LOG_RETENTION_BATCH_SIZE", default=5000, is_type_of=int, gte=1),
+    # API日志归档配置, 天数为 0 表示不归档
+    Validator("LOG_ARCHIVE_ROOT", default="logs/archive", is_type_of=str),
+    Validator("LOG_ARCHIVE_AFTER_DAYS", default=0, is_type_of=int, gte=0),
+    Validator("LOG_ARCHIVE_SEGMENT_ROWS", default=10000, is_type_of=int, gte=1),
+    Validator("LOG_ARCHIVE_ZSTD_LEVEL", default=3, is_type_of=int, gte=1, lte=22),
+    # 限流配置, 次数为 0 表示不限流
+    Validator("RATE_LIMIT_LOGIN_USER", default=10, is_type_of=int, gte=0),
+    Validator("RATE_LIMIT_LOGIN_IP", default=30, is_type_of=int, gte=0),
+    Validator("RATE_LIMIT_LOGIN_WINDOW", default=60, is_type_of=int, gte=1),
+    Validator("RATE_LIMIT_ERROR_IP", default=1, is_type_of=int, gte=0),
+    Validator("RATE_LIMIT_ERROR_WINDOW", default=1, is_type_of=int, gte=1),
     # CORS 配置 - 只在 default 环境验证
     Validator("CORS_ORIGINS", must_exist=True, is_type_of=list, env="default"),
     Validator("CORS_ALLOW_CREDENTIALS", must_exist=True, is_type_of=bool, env="default"),
@@ -123,7 +187,7 @@ class ConfigProxy:
     def _process_value(self, name: str, value: Any) -> Any:
         """处理配置值，进行类型转换"""
         # 路径相关配置转换为 Path 对象
-        if name in ("LOGS_ROOT", "STATIC_ROOT") and isinstance(value, str):
+        if name in ("LOGS_ROOT", "STATIC_ROOT", "LOG_ARCHIVE_ROOT", "AUDIT_LOG_SPOOL_ROOT") and isinstance(value, str):
             return PROJECT_ROOT / value
         return value
 
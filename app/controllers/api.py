@@ -1,11 +1,11 @@
-from app.core.crud import CRUDBase
+from app.core.crud import CRUDBase, list_count_strategy
 from app.models.system import Api
 from app.schemas.apis import ApiCreate, ApiUpdate
 
 
 class ApiController(CRUDBase[Api, ApiCreate, ApiUpdate]):
     def __init__(self):
-        super().__init__(model=Api)
+        super().__init__(model=Api, count_strategy=list_count_strategy("apis"))
 
 
 api_controller = ApiController()
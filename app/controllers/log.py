@@ -1,11 +1,109 @@
-from app.core.crud import CRUDBase
-from app.models.system import Log
+import json
+from typing import Any
+
+from tortoise.expressions import Q, RawSQL
+
+from app.core.crud import (
+    WINDOW_TOTAL_FIELD,
+    CRUDBase,
+    Total,
+    decode_cursor,
+    encode_cursor,
+    keyset_order,
+    list_count_strategy,
+)
+from app.models.system import Log, LogType, values_to_dict
 from app.schemas.logs import LogCreate, LogUpdate
 
+LOG_FIELDS = ("id", "log_type", "log_detail_type", "create_time", "x_request_id")
+API_LOG_FIELDS = (
+    "id",
+    "x_request_id",
+    "ip_address",
+    "user_agent",
+    "request_domain",
+    "request_path",
+    "request_method",
+    "route_path",
+    "request_params",
+    "request_data",
+    "response_data",
+    "response_code",
+    "create_time",
+    "process_time",
+)
+
 
 class LogController(CRUDBase[Log, LogCreate, LogUpdate]):
+    # 日志列表排序
+    list_order = ["-id"]
+
     def __init__(self):
-        super().__init__(model=Log)
+        super().__init__(model=Log, count_strategy=list_count_strategy("logs"))
+
+    async def list_records(
+        self, page: int, page_size: int, search: Q, log_type: LogType, cursor: str | None = None
+    ) -> tuple[Total, list[dict[str, Any]], int | None]:
+        """
+        分页查询日志列表记录
+
+        一次关联 logs / api_logs / users 的投影查询取回整页数据, 再批量组装为列表接口的结构,
+        查询次数与每页数量无关
+
+        参数:
+        - page: 页码
+        - page_size: 每页数量
+        - search: 查询条件
+        - log_type: 日志类型, 决定关联的表及记录结构
+        - cursor: 游标, 见 CRUDBase.list
+
+        返回:
+        - (Total, list[dict], int | None): 总数、当前页记录及当前页最后一条日志的 id
+        """
+        fields = list(LOG_FIELDS)
+        if log_type == LogType.ApiLog:
+            fields += [f"api_log__{field}" for field in API_LOG_FIELDS]
+        elif log_type != LogType.SystemLog:
+            fields += ["by_user_id", "by_user__nick_name"]
+
+        query = self.model.filter(search)
+        page_query = self.paginate(query, page, page_size, self.list_order, cursor)
+        if self.use_window_count(self.count_strategy, cursor):
+            rows = await page_query.annotate(**{WINDOW_TOTAL_FIELD: RawSQL("COUNT(*) OVER()")}).values(
+                *fields, WINDOW_TOTAL_FIELD
+            )
+            total = await self.window_total(query, rows[0][WINDOW_TOTAL_FIELD] if rows else None, page)
+        else:
+            total = await self.count(query, self.count_strategy)
+            rows = await page_query.values(*fields)
+        return total, [self._to_record(row, log_type) for row in rows], rows[-1]["id"] if rows else None
+
+    def cursor_log_id(self, cursor: str) -> int | None:
+        """游标对应的日志 id, 空字符串(第一页)返回 None"""
+        return decode_cursor(keyset_order(self.list_order), cursor)[0] if cursor else None
+
+    def make_cursor(self, log_id: int) -> str:
+        """由日志 id 生成游标"""
+        return encode_cursor(keyset_order(self.list_order), {"id": log_id})
+
+    @staticmethod
+    def _to_record(row: dict[str, Any], log_type: LogType) -> dict[str, Any]:
+        record = values_to_dict({field: row[field] for field in LOG_FIELDS})
+        if log_type == LogType.ApiLog:
+            if row["api_log__id"] is not None:
+                record.update(values_to_dict(row, prefix="api_log__"))
+                record["requestParams"] = json.dumps(record["requestParams"], ensure_ascii=False)
+                record["responseData"] = json.dumps(record["responseData"], ensure_ascii=False)
+            return {"logUser": "Request", **record}
+
+        if log_type == LogType.SystemLog:
+            record["logUser"] = "System"
+        elif row["by_user_id"] is not None:
+            record["byUser"] = str(row["by_user_id"])
+            record["byUserInfo"] = {"id": row["by_user_id"], "nickName": row["by_user__nick_name"]}
+        else:
+            record["byUser"] = None
+        return record
 
 
 log_controller = LogController()
@@ -1,13 +1,14 @@
 from loguru import logger
 
-from app.core.crud import CRUDBase
+from app.core.crud import CRUDBase, list_count_strategy
+from app.core.permission import permission_cache
 from app.models.system import Button, Menu
 from app.schemas.menus import ButtonBase, MenuCreate, MenuUpdate
 
 
 class MenuController(CRUDBase[Menu, MenuCreate, MenuUpdate]):
     def __init__(self):
-        super().__init__(model=Menu)
+        super().__init__(model=Menu, count_strategy=list_count_strategy("menus"))
 
     async def get_by_menu_name(self, menu_name: str) -> Menu | None:
         return await self.model.filter(menu_name=menu_name).first()
@@ -40,6 +41,7 @@ class MenuController(CRUDBase[Menu, MenuCreate, MenuUpdate]):
             )
             await menu.by_menu_buttons.add(button_obj)
 
+        await permission_cache.bump_role_versions()
         return True
 
 
@@ -1,11 +1,12 @@
-from app.core.crud import CRUDBase
+from app.core.crud import CRUDBase, list_count_strategy
+from app.core.permission import permission_cache
 from app.models.system import Api, Button, Role
 from app.schemas.roles import RoleCreate, RoleUpdate
 
 
 class RoleController(CRUDBase[Role, RoleCreate, RoleUpdate]):
     def __init__(self):
-        super().__init__(model=Role)
+        super().__init__(model=Role, count_strategy=list_count_strategy("roles"))
 
     async def is_exist(self, role_name: str) -> bool:
         return await self.model.filter(role_name=role_name).exists()
@@ -28,6 +29,7 @@ class RoleController(CRUDBase[Role, RoleCreate, RoleUpdate]):
         for button_code in buttons_codes:
             button_obj = await Button.get(button_code=button_code)
             await role.by_role_buttons.add(button_obj)
+        await permission_cache.bump_role_versions([role.id])
         return True
 
     @staticmethod
@@ -39,6 +41,7 @@ class RoleController(CRUDBase[Role, RoleCreate, RoleUpdate]):
         for api_code in apis_codes:
             api_obj = await Api.get(api_code=api_code)
             await role.apis.add(api_obj)
+        await permission_cache.bump_role_versions([role.id])
         return True
 
 
@@ -1,19 +1,81 @@
+import asyncio
 from datetime import datetime
 
 from tortoise.transactions import in_transaction
 
-from app.core.crud import CRUDBase
+from app.core.audit import audit_log_writer
+from app.core.crud import CRUDBase, list_count_strategy
 from app.core.constants import ErrorCode
+from app.core.ctx import CTX_X_REQUEST_ID
 from app.core.exceptions import HTTPException
-from app.models.system import LogDetailType, LogType, Role, StatusType, User, Log
+from app.core.permission import permission_cache
+from app.log import log
+from app.models.system import LogDetailType, LogType, Role, StatusType, User
 from app.schemas.login import CredentialsSchema
 from app.schemas.users import UserCreate, UserUpdate, UserSearch
 from app.utils.security import get_password_hash, verify_password
+from app.configs import APP_SETTINGS
+
+
+class LastLoginWriter:
+    """
+    最后登录时间的延迟写入器
+    登录及刷新令牌时只记录到内存, 同一用户多次登录合并为一条, 定期以单条 UPDATE ... CASE 批量写回
+    """
+
+    def __init__(self, interval: float = 10, batch_size: int = 500):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending: dict[int, datetime] = {}
+        self._task: asyncio.Task | None = None
+
+    def touch(self, user_id: int, login_time: datetime | None = None) -> None:
+        """记录用户的最后登录时间, 等待下次批量写回"""
+        self._pending[user_id] = login_time or datetime.now()
+
+    async def flush(self) -> int:
+        """写回已记录的最后登录时间, 返回写回的用户数"""
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        users = [User(id=user_id, last_login=login_time) for user_id, login_time in pending.items()]
+        try:
+            await User.bulk_update(users, fields=["last_login"], batch_size=self.batch_size)
+        except Exception as e:
+            # 写回失败时放回缓冲区, 期间的新记录优先
+            self._pending = pending | self._pending
+            log.warning(f"Failed to flush last login time: {e!r}")
+            return 0
+        return len(users)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止定时写回并写回剩余记录"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
 
 
 class UserController(CRUDBase[User, UserCreate, UserUpdate]):
+    # 用户列表排序
+    list_order = ["id"]
+
     def __init__(self):
-        super().__init__(model=User)
+        super().__init__(model=User, count_strategy=list_count_strategy("users"))
 
     async def get_by_email(self, user_email: str) -> User | None:
         return await self.model.filter(user_email=user_email).first()
@@ -34,7 +96,11 @@ class UserController(CRUDBase[User, UserCreate, UserUpdate]):
             )
             if obj_in.by_user_role_code_list:
                 await self.update_roles_by_code(obj, obj_in.by_user_role_code_list)
-            return obj
+
+        # 事务提交后再同步权限版本, 避免其他进程按未提交的授权缓存判定结果
+        if obj_in.by_user_role_code_list:
+            await permission_cache.publish_versions(user_ids=[obj.id])
+        return obj
 
     async def update(self, user_id: int, obj_in: UserUpdate) -> User:  # type: ignore
         # 密码哈希计算移到事务外（异步且不阻塞）
@@ -50,7 +116,10 @@ class UserController(CRUDBase[User, UserCreate, UserUpdate]):
                 )
                 if obj_in.by_user_role_code_list:
                     await self.update_roles_by_code(obj, obj_in.by_user_role_code_list)
-                return obj
+
+            # 角色或状态可能已变化, 提交后同步权限版本并轮换该用户的权限戳
+            await permission_cache.publish_versions(user_ids=[obj.id])
+            return obj
         except Exception as e:
             import traceback
             from loguru import logger
@@ -59,29 +128,34 @@ class UserController(CRUDBase[User, UserCreate, UserUpdate]):
             raise e
 
     async def update_last_login(self, user_id: int) -> None:
-        user = await self.model.get(id=user_id)
-        user.last_login = datetime.now()
-        await user.save()
+        last_login_writer.touch(user_id)
+
+    @staticmethod
+    async def _add_login_log(user_id: int | None, log_detail_type: LogDetailType) -> None:
+        await audit_log_writer.add_log(
+            {
+                "log_type": LogType.UserLog,
+                "log_detail_type": log_detail_type,
+                "by_user_id": user_id,
+                "x_request_id": CTX_X_REQUEST_ID.get(),
+            }
+        )
 
     async def authenticate(self, credentials: CredentialsSchema) -> User:
         user = await self.model.filter(user_name=credentials.user_name).first()
 
         if not user:
-            await Log.create(
-                log_type=LogType.UserLog, by_user=None, log_detail_type=LogDetailType.UserLoginUserNameVaild
-            )
+            await self._add_login_log(None, LogDetailType.UserLoginUserNameVaild)
             raise HTTPException(code=ErrorCode.AUTH_LOGIN_FAILED, msg="Incorrect username or password!")
 
         verified = await verify_password(credentials.password, user.password)
 
         if not verified:
-            await Log.create(
-                log_type=LogType.UserLog, by_user=user, log_detail_type=LogDetailType.UserLoginErrorPassword
-            )
+            await self._add_login_log(user.id, LogDetailType.UserLoginErrorPassword)
             raise HTTPException(code=ErrorCode.AUTH_LOGIN_FAILED, msg="Incorrect username or password!")
 
         if user.status_type == StatusType.disable:
-            await Log.create(log_type=LogType.UserLog, by_user=user, log_detail_type=LogDetailType.UserLoginForbid)
+            await self._add_login_log(user.id, LogDetailType.UserLoginForbid)
             raise HTTPException(code=ErrorCode.AUTH_LOGIN_FAILED, msg="This user has been disabled.")
 
         return user
@@ -112,9 +186,10 @@ class UserController(CRUDBase[User, UserCreate, UserUpdate]):
             page=obj_in.current,
             page_size=obj_in.size,
             search=q,
-            order=["id"],
+            order=self.list_order,
             prefetch=["by_user_roles"],
             distinct=True,  # 涉及多对多关联查询，必须去重
+            cursor=obj_in.cursor,
         )
 
     @staticmethod
@@ -125,16 +200,23 @@ class UserController(CRUDBase[User, UserCreate, UserUpdate]):
         if isinstance(role_id_list, str):
             role_id_list = role_id_list.split("|")
 
+        old_role_ids: list[int] = await user.by_user_roles.all().values_list("id", flat=True)
         await user.by_user_roles.clear()
         user_role_objs = await Role.filter(id__in=role_id_list)
 
         for user_role_obj in user_role_objs:
             await user.by_user_roles.add(user_role_obj)
 
+        await permission_cache.bump_role_versions([*old_role_ids, *(role.id for role in user_role_objs)])
+        await permission_cache.publish_versions(user_ids=[user.id])
         return True
 
     @staticmethod
     async def update_roles_by_code(user: User, roles_code_list: list[str] | str) -> bool:
+        """
+        按角色编码重置用户角色, 并递增新旧角色的权限版本
+        通常在事务中调用, 调用方需在事务提交后执行 permission_cache.publish_versions(user_ids=[user.id])
+        """
         if not roles_code_list:
             return False
 
@@ -142,11 +224,16 @@ class UserController(CRUDBase[User, UserCreate, UserUpdate]):
             roles_code_list = roles_code_list.split("|")
 
         user_role_objs = await Role.filter(role_code__in=roles_code_list)
+        old_role_ids: list[int] = await user.by_user_roles.all().values_list("id", flat=True)
         await user.by_user_roles.clear()
         for user_role_obj in user_role_objs:
             await user.by_user_roles.add(user_role_obj)
 
+        await permission_cache.bump_role_versions(
+            [*old_role_ids, *(role.id for role in user_role_objs)], publish=False
+        )
         return True
 
 
+last_login_writer = LastLoginWriter(interval=APP_SETTINGS.get("LAST_LOGIN_FLUSH_INTERVAL", 10))
 user_controller = UserController()
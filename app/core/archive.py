@@ -0,0 +1,493 @@
+"""
+API日志归档模块
+超出热数据窗口的 api_logs 及其 ApiLog 类型的 logs 按批导出为 zstd 压缩的只追加分段文件, 写入成功后从数据库删除
+- 每个分段附带索引: 时间范围、x_request_id 布隆过滤器、请求路径字典、路由模板字典
+- 查询时先按索引排除不相关的分段, 只解压可能命中的分段
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+from collections import deque
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from compression import zstd
+from tortoise import timezone
+
+from app.core.crud import CountStrategy, Total
+from app.log import log
+from app.models.system import APILog, Log, LogType
+from app.configs import APP_SETTINGS
+
+
+def _epoch_ms(value: datetime) -> int:
+    """datetime 转毫秒时间戳, 无时区信息时按数据库时区处理"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return int(value.timestamp() * 1000)
+
+
+class BloomFilter:
+    """定长位数组布隆过滤器, 使用 blake2b 的双重哈希生成 k 个位置"""
+
+    def __init__(self, size: int, hashes: int = 7, bits: bytearray | None = None):
+        self.size = max(size, 64)
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, bits_per_item: int = 10) -> BloomFilter:
+        # 每项 10 位、7 个哈希时误判率约 1%
+        return cls(capacity * bits_per_item)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: str) -> None:
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"size": self.size, "hashes": self.hashes, "bits": base64.b64encode(self.bits).decode()}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> BloomFilter:
+        return cls(data["size"], data["hashes"], bytearray(base64.b64decode(data["bits"])))
+
+
+@dataclass(slots=True)
+class SegmentIndex:
+    """分段索引"""
+
+    name: str
+    rows: int
+    min_id: int
+    max_id: int
+    min_time: int
+    max_time: int
+    paths: list[str]
+    bloom: BloomFilter
+    # 早期的分段没有路由模板字典
+    routes: list[str] = field(default_factory=list)
+
+    def may_match(
+        self,
+        start: int | None,
+        end: int | None,
+        request_path: str | None,
+        route_path: str | None,
+        x_request_id: str | None,
+    ) -> bool:
+        if start is not None and self.max_time < start:
+            return False
+        if end is not None and self.min_time >= end:
+            return False
+        if request_path and not any(path.startswith(request_path) for path in self.paths):
+            return False
+        if route_path and route_path not in self.routes:
+            return False
+        if x_request_id and x_request_id not in self.bloom:
+            return False
+        return True
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "rows": self.rows,
+            "min_id": self.min_id,
+            "max_id": self.max_id,
+            "min_time": self.min_time,
+            "max_time": self.max_time,
+            "paths": self.paths,
+            "bloom": self.bloom.to_dict(),
+            "routes": self.routes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> SegmentIndex:
+        return cls(**{**data, "bloom": BloomFilter.from_dict(data["bloom"])})
+
+
+class LogArchive:
+    """
+    API日志冷归档
+
+    - 分段文件写入临时文件后原子重命名, 写入完成后不再修改
+    - 分段内按 id 升序保存, 请求路径及路由模板以字典下标存储
+    - 导出后崩溃导致未删除的行, 下次按已归档的最大 id 识别并直接删除, 不重复归档
+    """
+
+    SEGMENT_SUFFIX = ".jsonl.zst"
+    INDEX_SUFFIX = ".idx.json"
+
+    def __init__(self, root: Path | str, after_days: int = 0, segment_rows: int = 10000, level: int = 3):
+        """
+        Args:
+            root: 分段文件目录
+            after_days: 超过该天数的API日志被归档, 0 表示不归档
+            segment_rows: 每个分段的最大行数
+            level: zstd 压缩级别
+        """
+        self.root = Path(root)
+        self.after_days = after_days
+        self.segment_rows = segment_rows
+        self.level = level
+        self._segments: dict[str, SegmentIndex] = {}
+        self._root_mtime: float | None = None
+        self.stats = {"archived": 0, "segments_written": 0, "segments_scanned": 0, "segments_skipped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    @property
+    def max_archived_id(self) -> int:
+        return max((segment.max_id for segment in self._segments.values()), default=0)
+
+    @property
+    def max_archived_time(self) -> int | None:
+        return max((segment.max_time for segment in self._segments.values()), default=None)
+
+    def refresh(self) -> None:
+        """目录有变化时(其他进程写入或删除分段)重新加载索引"""
+        try:
+            mtime = self.root.stat().st_mtime
+        except FileNotFoundError:
+            self._segments.clear()
+            self._root_mtime = None
+            return
+        if mtime == self._root_mtime:
+            return
+
+        segments = {}
+        for path in self.root.glob(f"*{self.INDEX_SUFFIX}"):
+            name = path.name.removesuffix(self.INDEX_SUFFIX)
+            if (segment := self._segments.get(name)) is None:
+                try:
+                    segment = SegmentIndex.from_dict(json.loads(path.read_text(encoding="utf-8")))
+                except (OSError, ValueError, KeyError) as e:
+                    log.warning(f"Skip unreadable archive index {path.name}: {e!r}")
+                    continue
+            segments[name] = segment
+        self._segments = segments
+        self._root_mtime = mtime
+
+    def covers(self, start: datetime | None) -> bool:
+        """查询起始时间是否早于已归档数据的最新时间, 即查询范围是否涉及归档"""
+        if not self.enabled:
+            return False
+        self.refresh()
+        max_time = self.max_archived_time
+        return max_time is not None and (start is None or _epoch_ms(start) <= max_time)
+
+    def _write_segment(self, rows: list[dict[str, Any]]) -> SegmentIndex:
+        self.root.mkdir(parents=True, exist_ok=True)
+        paths: dict[str, int] = {}
+        routes: dict[str, int] = {}
+        bloom = BloomFilter.for_capacity(len(rows))
+        times = [row["create_ts"] for row in rows]
+        name = f"api_logs-{rows[0]['id']:012d}-{rows[-1]['id']:012d}"
+
+        tmp_path = self.root / f".{name}{self.SEGMENT_SUFFIX}.tmp"
+        with zstd.open(tmp_path, "wt", level=self.level, encoding="utf-8") as f:
+            for row in rows:
+                bloom.add(row["x_request_id"])
+                row["request_path"] = paths.setdefault(row["request_path"], len(paths))
+                if row["route_path"] is not None:
+                    row["route_path"] = routes.setdefault(row["route_path"], len(routes))
+                f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+        os.replace(tmp_path, self.root / f"{name}{self.SEGMENT_SUFFIX}")
+
+        segment = SegmentIndex(
+            name=name,
+            rows=len(rows),
+            min_id=rows[0]["id"],
+            max_id=rows[-1]["id"],
+            min_time=min(times),
+            max_time=max(times),
+            paths=list(paths),
+            bloom=bloom,
+            routes=list(routes),
+        )
+        # 索引最后写入, 只有索引存在的分段才参与查询
+        tmp_index = self.root / f".{name}{self.INDEX_SUFFIX}.tmp"
+        tmp_index.write_text(json.dumps(segment.to_dict()), encoding="utf-8")
+        os.replace(tmp_index, self.root / f"{name}{self.INDEX_SUFFIX}")
+        return segment
+
+    def _iter_segment(self, segment: SegmentIndex) -> Iterator[dict[str, Any]]:
+        """按 id 升序逐行解压读取分段, 不整体载入内存"""
+        with zstd.open(self.root / f"{segment.name}{self.SEGMENT_SUFFIX}", "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                row["request_path"] = segment.paths[row["request_path"]]
+                if (route := row.get("route_path")) is not None:
+                    row["route_path"] = segment.routes[route]
+                yield row
+
+    async def archive_before(self, cutoff: datetime) -> int:
+        """
+        归档早于 cutoff 的API日志, 返回归档的行数
+
+        Args:
+            cutoff: 截止时间
+        """
+        if not self.enabled:
+            return 0
+
+        await asyncio.to_thread(self.refresh)
+        archived = 0
+        while True:
+            api_logs = await APILog.filter(create_time__lt=cutoff).order_by("id").limit(self.segment_rows).values()
+            if not api_logs:
+                break
+
+            ids = [row["id"] for row in api_logs]
+            new_rows = [row for row in api_logs if row["id"] > self.max_archived_id]
+            if new_rows:
+                logs = await Log.filter(log_type=LogType.ApiLog, api_log_id__in=[row["id"] for row in new_rows]).values(
+                    "id", "api_log_id", "log_detail_type", "by_user_id"
+                )
+                logs_by_api_log = {row["api_log_id"]: row for row in logs}
+                rows = []
+                for api_log in new_rows:
+                    log_row = logs_by_api_log.get(api_log["id"], {})
+                    create_time: datetime = api_log["create_time"]
+                    detail_type = log_row.get("log_detail_type")
+                    rows.append(
+                        {
+                            **api_log,
+                            "create_time": create_time.isoformat(),
+                            "create_ts": _epoch_ms(create_time),
+                            "log_id": log_row.get("id"),
+                            "log_detail_type": getattr(detail_type, "value", detail_type),
+                            "by_user_id": log_row.get("by_user_id"),
+                        }
+                    )
+                segment = await asyncio.to_thread(self._write_segment, rows)
+                self._segments[segment.name] = segment
+                self.stats["segments_written"] += 1
+                archived += len(rows)
+
+            # 分段落盘后再删除数据库中的记录
+            await Log.filter(log_type=LogType.ApiLog, api_log_id__in=ids).delete()
+            await APILog.filter(id__in=ids).delete()
+            if len(api_logs) < self.segment_rows:
+                break
+            await asyncio.sleep(0)
+
+        self.stats["archived"] += archived
+        return archived
+
+    def expire_before(self, cutoff: datetime) -> int:
+        """删除最新记录早于 cutoff 的分段, 返回删除的分段数"""
+        self.refresh()
+        cutoff_ms = _epoch_ms(cutoff)
+        expired = [segment for segment in self._segments.values() if segment.max_time < cutoff_ms]
+        for segment in expired:
+            # 先删索引, 保证查询不会读到缺失的分段
+            (self.root / f"{segment.name}{self.INDEX_SUFFIX}").unlink(missing_ok=True)
+            (self.root / f"{segment.name}{self.SEGMENT_SUFFIX}").unlink(missing_ok=True)
+            self._segments.pop(segment.name, None)
+        return len(expired)
+
+    def _search(
+        self,
+        start: int | None,
+        end: int | None,
+        request_path: str | None,
+        route_path: str | None,
+        request_method: str | None,
+        response_code: str | None,
+        x_request_id: str | None,
+        log_detail_type: str | None,
+        by_user_id: int | None,
+        before_log_id: int | None,
+        offset: int,
+        limit: int,
+        count_strategy: CountStrategy,
+        count_cap: int,
+    ) -> tuple[Total, list[dict[str, Any]]]:
+        self.refresh()
+        filtered = any(
+            value is not None and value != ""
+            for value in (request_path, route_path, request_method, response_code, x_request_id, log_detail_type)
+        ) or (by_user_id is not None)
+
+        def matches(row: dict[str, Any]) -> bool:
+            return not (
+                (start is not None and row["create_ts"] < start)
+                or (end is not None and row["create_ts"] >= end)
+                or (request_path and not row["request_path"].startswith(request_path))
+                or (route_path and row.get("route_path") != route_path)
+                or (request_method and row.get("request_method") != request_method)
+                or (response_code and row["response_code"] != response_code)
+                or (x_request_id and row["x_request_id"] != x_request_id)
+                or (log_detail_type and row["log_detail_type"] != log_detail_type)
+                or (by_user_id is not None and row["by_user_id"] != by_user_id)
+            )
+
+        total = 0
+        exact = True
+        skipped = 0
+        records: list[dict[str, Any]] = []
+        # 与数据库查询一致按 id 倒序, 新的分段在前
+        for segment in sorted(self._segments.values(), key=lambda s: s.max_id, reverse=True):
+            if not segment.may_match(start, end, request_path, route_path, x_request_id):
+                self.stats["segments_skipped"] += 1
+                continue
+
+            # 本分段中还需要的行数(含待跳过的行), 为 0 时只为计数
+            needed = offset - skipped + limit - len(records)
+            if needed <= 0:
+                covered = (start is None or segment.min_time >= start) and (end is None or segment.max_time < end)
+                if not filtered and covered:
+                    # 分段整体位于时间范围内且无其他条件, 行数即匹配数, 无需解压
+                    total += segment.rows
+                    continue
+                if count_strategy == CountStrategy.estimated:
+                    total += segment.rows
+                    exact = False
+                    continue
+                if count_strategy == CountStrategy.capped and total >= count_cap:
+                    exact = False
+                    break
+
+            self.stats["segments_scanned"] += 1
+            # 分段内按 id 升序, 只保留最新的 needed 条可返回的行, 内存占用与分段大小无关
+            newest: deque[dict[str, Any]] = deque(maxlen=max(needed, 0))
+            eligible = 0
+            for row in self._iter_segment(segment):
+                if not matches(row):
+                    continue
+                total += 1
+                # 游标模式只返回日志 id 位于游标之后的记录, 总数仍包含全部匹配的记录
+                if before_log_id is not None and (row["log_id"] or 0) >= before_log_id:
+                    continue
+                eligible += 1
+                if needed > 0:
+                    newest.append(row)
+
+            to_skip = offset - skipped
+            if eligible <= to_skip:
+                skipped += eligible
+            else:
+                skipped = offset
+                records.extend(list(reversed(newest))[to_skip : to_skip + limit - len(records)])
+
+        if count_strategy == CountStrategy.capped and total > count_cap:
+            return Total(count_cap, exact=False), records
+        return Total(total, exact=exact), records
+
+    async def search(
+        self,
+        time_range: list[datetime] | None = None,
+        request_path: str | None = None,
+        route_path: str | None = None,
+        request_method: str | None = None,
+        response_code: str | None = None,
+        x_request_id: str | None = None,
+        log_detail_type: str | None = None,
+        by_user_id: int | None = None,
+        before_log_id: int | None = None,
+        offset: int = 0,
+        limit: int = 10,
+        count_strategy: CountStrategy | str = CountStrategy.exact,
+        counted: int = 0,
+    ) -> tuple[Total, list[dict[str, Any]]]:
+        """
+        查询归档的API日志, 条件与 /system-manage/logs/all 一致, before_log_id 用于游标分页
+
+        从最新的分段开始逐段流式读取, 取满 offset + limit 条记录后, 其余分段只为计数读取:
+        - 分段整体位于时间范围内且无其他条件时直接使用索引中的行数
+        - capped: 与 counted 合计达到 LIST_COUNT_CAP 后停止并标记为非精确
+        - estimated: 不再解压, 以分段行数估算并标记为非精确
+        - 其他方式精确计数
+
+        Args:
+            count_strategy: 总数计算方式, 与日志列表一致
+            counted: 已计入总数的行数(数据库中的匹配数), capped 时与归档的匹配数合计不超过上限
+
+        Returns:
+            tuple[Total, list[dict]]: 匹配的总数及 offset 起的至多 limit 条记录(按 id 倒序)
+        """
+        if not self.enabled:
+            return Total(0), []
+
+        start = _epoch_ms(time_range[0]) if time_range else None
+        end = _epoch_ms(time_range[1]) if time_range else None
+        return await asyncio.to_thread(
+            self._search,
+            start,
+            end,
+            request_path,
+            route_path,
+            request_method,
+            response_code,
+            x_request_id,
+            log_detail_type,
+            by_user_id,
+            before_log_id,
+            offset,
+            limit,
+            CountStrategy(count_strategy),
+            max(APP_SETTINGS.get("LIST_COUNT_CAP", 10000) - counted, 0),
+        )
+
+    @staticmethod
+    def to_record(row: dict[str, Any]) -> dict[str, Any]:
+        """归档行转换为与 /system-manage/logs/all 相同结构的记录"""
+        create_time = datetime.fromisoformat(row["create_time"])
+        return {
+            "logUser": "Request",
+            "id": row["id"],
+            "logType": LogType.ApiLog.value,
+            "logDetailType": row["log_detail_type"],
+            "xRequestId": row["x_request_id"],
+            "ipAddress": row["ip_address"],
+            "userAgent": row["user_agent"],
+            "requestDomain": row["request_domain"],
+            "requestPath": row["request_path"],
+            "requestMethod": row.get("request_method"),
+            "routePath": row.get("route_path"),
+            "requestParams": json.dumps(row["request_params"], ensure_ascii=False),
+            "requestData": row["request_data"],
+            "responseData": json.dumps(row["response_data"], ensure_ascii=False),
+            "responseCode": row["response_code"],
+            "fmtCreateTime": create_time.strftime(APP_SETTINGS.DATETIME_FORMAT),
+            "createTime": int(create_time.timestamp() * 1000),
+            "processTime": row["process_time"],
+            "archived": True,
+        }
+
+    def get_stats(self) -> dict[str, Any]:
+        self.refresh()
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "after_days": self.after_days,
+            "segments": len(self._segments),
+            "rows": sum(segment.rows for segment in self._segments.values()),
+        }
+
+
+log_archive = LogArchive(
+    root=APP_SETTINGS.get("LOG_ARCHIVE_ROOT", "logs/archive"),
+    after_days=APP_SETTINGS.get("LOG_ARCHIVE_AFTER_DAYS", 0),
+    segment_rows=APP_SETTINGS.get("LOG_ARCHIVE_SEGMENT_ROWS", 10000),
+    level=APP_SETTINGS.get("LOG_ARCHIVE_ZSTD_LEVEL", 3),
+)
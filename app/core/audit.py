@@ -0,0 +1,630 @@
+"""
+审计日志写入模块
+请求链路只将日志放入进程内队列, 由后台任务按时间间隔或批量大小以 bulk_create 批量写入数据库
+数据库不可用或写入跟不上时, 日志转存到本地磁盘缓冲, 恢复后再回放写入
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import orjson
+from tortoise import fields, timezone
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from app.log import log
+from app.models.system import APILog, Log, LogDetailType, LogType
+from app.configs import APP_SETTINGS
+
+try:
+    import fcntl
+except ImportError:  # Windows 下不加文件锁, 仅支持单进程使用缓冲目录
+    fcntl = None
+
+
+# 一批日志: (API 日志, Log)
+LogBatch = tuple[list[dict[str, Any]], list[dict[str, Any]]]
+
+
+def _max_lengths(model: type[Model]) -> dict[str, int]:
+    """模型中有长度限制的字符字段 -> 最大长度"""
+    return {
+        name: field.max_length
+        for name, field in model._meta.fields_map.items()
+        if isinstance(field, fields.CharField) and field.max_length
+    }
+
+
+def clip_row(row: dict[str, Any], max_lengths: dict[str, int]) -> dict[str, Any]:
+    """
+    截断超出字段长度的字符串
+
+    bulk_create 不校验 max_length, 超长的值(如调用方传入的业务状态码、User-Agent)在 Postgres/MySQL 上会使整批写入失败
+    """
+    for name, max_length in max_lengths.items():
+        if type(value := row.get(name)) is str and len(value) > max_length:
+            row[name] = value[:max_length]
+    return row
+
+
+class AuditSpool:
+    """
+    审计日志磁盘缓冲
+
+    - 每批日志以一行 JSON 追加到本进程的分段文件, API 日志与 Log 同行保存, 回放时仍按 x_request_id 关联
+    - 写入中及回放中的分段持有文件锁, 多进程共享目录时互不干扰, 已退出进程留下的分段由任意进程回放
+    - 回放进度按行记录在 .offset 文件中, 中断后从断点继续
+    - 因数据错误无法写入的行移到 .rejected 文件, 不阻塞后续回放
+    - 文件读写及加锁在专用的单线程中按提交顺序执行, 不阻塞事件循环
+    """
+
+    SEGMENT_GLOB = "spool-*.jsonl"
+
+    def __init__(self, root: Path | str, max_bytes: int, segment_bytes: int = 16 * 1024 * 1024):
+        """
+        Args:
+            root: 缓冲目录
+            max_bytes: 缓冲文件总大小上限, 超出后丢弃
+            segment_bytes: 单个分段的大小, 超出后切换到新分段
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._file = None
+        self._file_size = 0
+        self._seq = 0
+        self._size = sum(path.stat().st_size for path in self.root.glob(self.SEGMENT_GLOB)) if self.root.exists() else 0
+        self.has_pending = self._size > 0
+        self.stats = {
+            "spooled_rows": 0,
+            "replayed_rows": 0,
+            "rejected_rows": 0,
+            "dead_letter_rows": 0,
+            "corrupt_lines": 0,
+        }
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit-spool")
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在缓冲的文件线程中运行 func"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _encode(api_logs: list[dict[str, Any]], logs: list[dict[str, Any]]) -> bytes:
+        return orjson.dumps({"api_logs": api_logs, "logs": logs}) + b"\n"
+
+    @staticmethod
+    def _decode(line: bytes) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        batch = orjson.loads(line)
+        for row in batch["api_logs"]:
+            row["create_time"] = datetime.fromisoformat(row["create_time"])
+        for row in batch["logs"]:
+            row["create_time"] = datetime.fromisoformat(row["create_time"])
+            row["log_type"] = LogType(row["log_type"])
+            if row.get("log_detail_type") is not None:
+                row["log_detail_type"] = LogDetailType(row["log_detail_type"])
+        return batch["api_logs"], batch["logs"]
+
+    def _open(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        name = f"spool-{timezone.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._seq:06d}.jsonl"
+        self._file = open(self.root / name, "ab")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        self._file_size = 0
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def close(self) -> None:
+        """关闭当前分段, 之后可被回放"""
+        await self._run(self._close)
+
+    async def append(self, api_logs: list[dict[str, Any]], logs: list[dict[str, Any]]) -> bool:
+        """
+        追加一批日志
+
+        Returns:
+            bool: 是否已写入, 超出大小上限或写入失败时为 False
+        """
+        return await self._run(self._append, api_logs, logs)
+
+    def _append(self, api_logs: list[dict[str, Any]], logs: list[dict[str, Any]]) -> bool:
+        rows = len(api_logs) + len(logs)
+        try:
+            data = self._encode(api_logs, logs)
+            if self._size + len(data) > self.max_bytes:
+                self.stats["rejected_rows"] += rows
+                return False
+
+            if self._file is None or self._file_size >= self.segment_bytes:
+                self._close()
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+        except (OSError, TypeError) as e:
+            log.warning(f"Failed to spool audit logs: {e!r}")
+            self.stats["rejected_rows"] += rows
+            return False
+
+        self._file_size += len(data)
+        self._size += len(data)
+        self.has_pending = True
+        self.stats["spooled_rows"] += rows
+        return True
+
+    def _reject(self, path: Path, line: bytes) -> None:
+        """无法写入数据库的行追加到分段对应的 .rejected 文件, 供人工排查, 不再回放"""
+        try:
+            with open(path.with_suffix(".rejected"), "ab") as f:
+                f.write(line)
+        except OSError as e:
+            log.warning(f"Failed to save rejected audit spool line: {e!r}")
+
+    def _segments(self) -> list[Path]:
+        return sorted(self.root.glob(self.SEGMENT_GLOB))
+
+    def _lock_segment(self, path: Path) -> tuple[BinaryIO, int] | None:
+        """打开分段并加锁, 定位到回放进度, 返回文件及进度; 其他进程正在写入或回放时返回 None"""
+        f = open(path, "rb")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    f.close()
+                    return None
+            offset_path = path.with_suffix(".offset")
+            offset = int(offset_path.read_text()) if offset_path.exists() else 0
+            f.seek(offset)
+        except BaseException:
+            f.close()
+            raise
+        return f, offset
+
+    def _remove_segment(self, path: Path, offset: int) -> None:
+        """删除回放完成的分段及其进度文件"""
+        self._size = max(self._size - offset, 0)
+        path.unlink(missing_ok=True)
+        path.with_suffix(".offset").unlink(missing_ok=True)
+
+    async def drain(
+        self,
+        write: Callable[[list[dict[str, Any]], list[dict[str, Any]]], Awaitable[None]],
+        write_rows: Callable[[list[dict[str, Any]], list[dict[str, Any]]], Awaitable[tuple[int, LogBatch, LogBatch]]],
+        max_batches: int = 20,
+    ) -> int:
+        """
+        回放缓冲的日志
+
+        - 整批写入失败时逐行重试, 出错的行及无法解析的行移到 .rejected 文件后继续回放
+        - 数据库不可用(一行也未能写入)时停止并保留回放进度; 逐行重试中途不可用时, 剩余的行重新追加到缓冲后停止
+
+        Args:
+            write: 写入一批日志的函数
+            write_rows: 逐行写入一批日志的函数, 返回写入的行数、出错的行及未写入的行
+            max_batches: 本次最多回放的批数, 避免长时间占用写入任务
+
+        Returns:
+            int: 回放的行数
+        """
+        await self.close()
+        replayed = 0
+        batches = 0
+        try:
+            for path in await self._run(self._segments):
+                if (segment := await self._run(self._lock_segment, path)) is None:
+                    # 其他进程正在写入或回放
+                    continue
+                f, offset = segment
+                offset_path = path.with_suffix(".offset")
+                try:
+                    while line := await self._run(f.readline):
+                        if batches >= max_batches:
+                            return replayed
+                        unwritten: LogBatch = ([], [])
+                        try:
+                            api_logs, logs = self._decode(line)
+                        except (ValueError, KeyError, TypeError) as e:
+                            self.stats["corrupt_lines"] += 1
+                            log.warning(f"Skip corrupt audit spool line in {path.name}: {e!r}")
+                            await self._run(self._reject, path, line)
+                        else:
+                            try:
+                                await write(api_logs, logs)
+                                replayed += len(api_logs) + len(logs)
+                            except Exception:
+                                written, rejected, unwritten = await write_rows(api_logs, logs)
+                                if not written and not rejected[0] and not rejected[1]:
+                                    # 数据库不可用, 保留进度, 稍后重试
+                                    raise
+                                replayed += written
+                                if rejected[0] or rejected[1]:
+                                    self.stats["dead_letter_rows"] += len(rejected[0]) + len(rejected[1])
+                                    await self._run(self._reject, path, self._encode(*rejected))
+                                if (unwritten[0] or unwritten[1]) and not await self.append(*unwritten):
+                                    self.stats["dead_letter_rows"] += len(unwritten[0]) + len(unwritten[1])
+                                    await self._run(self._reject, path, self._encode(*unwritten))
+                        batches += 1
+                        offset += len(line)
+                        await self._run(offset_path.write_text, str(offset))
+                        if unwritten[0] or unwritten[1]:
+                            # 已写入的行不能重复回放, 跳过本行后停止
+                            raise ConnectionError("Database became unavailable while replaying audit spool")
+                finally:
+                    await self._run(f.close)
+                await self._run(self._remove_segment, path, offset)
+
+            self.has_pending = False
+        finally:
+            # 中途停止时已写入的行同样计入
+            self.stats["replayed_rows"] += replayed
+        return replayed
+
+    def get_stats(self) -> dict[str, Any]:
+        return {**self.stats, "pending_bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class AuditLogWriter:
+    """
+    批量审计日志写入器
+
+    - API 日志在响应发送完成后整条加入, 每个请求只写入一次
+    - Log 通过 x_request_id 关联 API 日志, 批量写入 API 日志后一次查询取回其 id
+    - 队列有界, 溢出策略: drop_new 丢弃新日志, drop_oldest 丢弃最早的日志, block 等待队列腾出空间,
+      spool 转存到磁盘缓冲
+    - 配置了磁盘缓冲时, 写入失败的批次转存到缓冲, 数据库恢复后在写入间隙回放
+    """
+
+    OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "block", "spool")
+    # 写入或回放失败后, 间隔该秒数再尝试回放
+    DRAIN_RETRY_SECONDS = 5
+
+    def __init__(
+        self,
+        flush_interval_ms: int = 200,
+        batch_size: int = 500,
+        max_queue: int = 10000,
+        overflow_policy: str = "drop_new",
+        spool: AuditSpool | None = None,
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy if overflow_policy in self.OVERFLOW_POLICIES else "drop_new"
+        self.spool = spool
+        self._drain_retry_at = 0.0
+        self._api_logs: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._logs: list[dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.stats = {
+            "queued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "spooled": 0,
+            "rejected": 0,
+            "flushes": 0,
+        }
+        self._api_log_lengths = _max_lengths(APILog)
+        self._log_lengths = _max_lengths(Log)
+
+    @property
+    def pending(self) -> int:
+        return len(self._api_logs) + len(self._logs)
+
+    async def _reserve(self, rows: int) -> bool:
+        """为新日志预留队列空间, 返回 False 表示队列已满"""
+        while self.pending + rows > self.max_queue:
+            if self.overflow_policy == "block" and self._task is not None:
+                self._space.clear()
+                self._wakeup.set()
+                await self._space.wait()
+            elif self.overflow_policy == "drop_oldest" and self._drop_oldest():
+                continue
+            else:
+                return False
+        return True
+
+    async def _spill(self, api_logs: list[dict[str, Any]], logs: list[dict[str, Any]], stat: str) -> bool:
+        """未能写入队列或数据库的日志转存到磁盘缓冲, 无缓冲或缓冲已满时计入 stat"""
+        rows = len(api_logs) + len(logs)
+        if self.spool is not None and await self.spool.append(api_logs, logs):
+            self.stats["spooled"] += rows
+            return True
+        self.stats[stat] += rows
+        return False
+
+    def _drop_oldest(self) -> bool:
+        before = self.pending
+        if self._logs:
+            log_data = self._logs.pop(0)
+            self._api_logs.pop(log_data.get("api_log_x_request_id"), None)
+        elif self._api_logs:
+            self._api_logs.popitem(last=False)
+        else:
+            return False
+        self.stats["dropped"] += before - self.pending
+        return True
+
+    def _queued(self, rows: int) -> None:
+        self.stats["queued"] += rows
+        if self.pending >= self.batch_size:
+            self._wakeup.set()
+
+    async def add_api_log(self, api_log_data: dict[str, Any], log_data: dict[str, Any]) -> bool:
+        """
+        加入一条 API 日志及其关联的 Log
+
+        Args:
+            api_log_data: APILog 字段, 需包含 x_request_id
+            log_data: Log 字段, 写入时自动关联到该 API 日志
+
+        Returns:
+            bool: 是否已加入队列
+        """
+        now = timezone.now()
+        api_log_row = clip_row({"create_time": now, **api_log_data}, self._api_log_lengths)
+        x_request_id = api_log_row["x_request_id"]
+        log_row = clip_row({"create_time": now, **log_data}, self._log_lengths)
+        log_row["api_log_x_request_id"] = x_request_id
+        if not await self._reserve(2):
+            return self.overflow_policy == "spool" and await self._spill([api_log_row], [log_row], "dropped")
+
+        self._api_logs[x_request_id] = api_log_row
+        self._logs.append(log_row)
+        self._queued(2)
+        return True
+
+    async def add_log(self, log_data: dict[str, Any]) -> bool:
+        """加入一条不关联 API 日志的 Log"""
+        log_row = clip_row({"create_time": timezone.now(), **log_data}, self._log_lengths)
+        if not await self._reserve(1):
+            return self.overflow_policy == "spool" and await self._spill([], [log_row], "dropped")
+
+        self._logs.append(log_row)
+        self._queued(1)
+        return True
+
+    async def _write(self, api_logs: list[dict[str, Any]], logs: list[dict[str, Any]]) -> None:
+        """在一个事务中写入一批日志, Log 按 api_log_x_request_id 关联同批写入的 API 日志"""
+        async with in_transaction():
+            api_log_ids = {}
+            if api_logs:
+                await APILog.bulk_create([APILog(**data) for data in api_logs], batch_size=self.batch_size)
+                api_log_ids = dict(
+                    await APILog.filter(x_request_id__in=[data["x_request_id"] for data in api_logs]).values_list(
+                        "x_request_id", "id"
+                    )
+                )
+
+            log_objs = []
+            for data in logs:
+                if (x_request_id := data.get("api_log_x_request_id")) is not None:
+                    data = {k: v for k, v in data.items() if k != "api_log_x_request_id"}
+                    data["api_log_id"] = api_log_ids.get(x_request_id)
+                log_objs.append(Log(**data))
+            if log_objs:
+                await Log.bulk_create(log_objs, batch_size=self.batch_size)
+
+    @staticmethod
+    async def _db_available() -> bool:
+        """数据库是否可用, 用于区分连接类的暂时性错误与个别行的数据错误"""
+        try:
+            await APILog._meta.db.execute_query("SELECT 1")
+        except Exception:
+            return False
+        return True
+
+    async def _write_rows(
+        self, api_logs: list[dict[str, Any]], logs: list[dict[str, Any]]
+    ) -> tuple[int, LogBatch, LogBatch]:
+        """
+        按请求逐个写入, 批量写入因个别行的数据错误失败后用于隔离出错的行
+
+        API 日志与关联的 Log 作为一个单元写入; 写入过程中数据库不可用时停止, 剩余单元原样返回
+
+        Returns:
+            tuple[int, LogBatch, LogBatch]: 写入的行数、出错的行及未写入的行
+        """
+        logs_by_request: dict[str, list[dict[str, Any]]] = {}
+        units: list[LogBatch] = []
+        for data in logs:
+            if (x_request_id := data.get("api_log_x_request_id")) is not None:
+                logs_by_request.setdefault(x_request_id, []).append(data)
+            else:
+                units.append(([], [data]))
+        for data in api_logs:
+            units.append(([data], logs_by_request.pop(data["x_request_id"], [])))
+        # 关联的 API 日志不在本批中的 Log 单独写入, 写入时按 x_request_id 查不到则不关联
+        units.extend(([], request_logs) for request_logs in logs_by_request.values())
+
+        written = 0
+        rejected: LogBatch = ([], [])
+        for index, (unit_api_logs, unit_logs) in enumerate(units):
+            try:
+                await self._write(unit_api_logs, unit_logs)
+            except Exception as e:
+                if not await self._db_available():
+                    unwritten: LogBatch = ([], [])
+                    for rest_api_logs, rest_logs in units[index:]:
+                        unwritten[0].extend(rest_api_logs)
+                        unwritten[1].extend(rest_logs)
+                    return written, rejected, unwritten
+                log.warning(f"Reject audit log rows: {e!r}")
+                rejected[0].extend(unit_api_logs)
+                rejected[1].extend(unit_logs)
+            else:
+                written += len(unit_api_logs) + len(unit_logs)
+        return written, rejected, ([], [])
+
+    async def flush(self) -> int:
+        """写入队列中的全部日志, 返回写入的行数"""
+        if not self.pending:
+            return 0
+
+        api_logs, self._api_logs = list(self._api_logs.values()), OrderedDict()
+        logs, self._logs = self._logs, []
+        self._space.set()
+
+        written = 0
+        try:
+            await self._write(api_logs, logs)
+            written = len(api_logs) + len(logs)
+        except Exception as e:
+            log.warning(f"Failed to flush audit logs: {e!r}")
+            unwritten = (api_logs, logs)
+            if await self._db_available():
+                # 数据库可用时失败由个别行引起, 逐个请求重试, 只丢弃出错的行
+                written, rejected, unwritten = await self._write_rows(api_logs, logs)
+                self.stats["rejected"] += len(rejected[0]) + len(rejected[1])
+            if unwritten[0] or unwritten[1]:
+                self._drain_retry_at = time.monotonic() + self.DRAIN_RETRY_SECONDS
+                await self._spill(*unwritten, "failed")
+
+        self.stats["written"] += written
+        self.stats["flushes"] += 1
+        return written
+
+    async def drain_spool(self) -> int:
+        """回放磁盘缓冲中的日志, 返回回放的行数"""
+        if self.spool is None or not self.spool.has_pending or time.monotonic() < self._drain_retry_at:
+            return 0
+        try:
+            replayed = await self.spool.drain(self._write, self._write_rows)
+        except Exception as e:
+            log.warning(f"Failed to replay spooled audit logs: {e!r}")
+            self._drain_retry_at = time.monotonic() + self.DRAIN_RETRY_SECONDS
+            return 0
+        self.stats["written"] += replayed
+        return replayed
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "spool": self.spool.get_stats() if self.spool is not None else None,
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台写入并写入剩余日志"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._space.set()
+        if self.spool is not None:
+            await self.spool.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            await self.drain_spool()
+
+
+class APILogSampler:
+    """
+    API日志采样器
+    按路径前缀(最长匹配)配置采样率; 出错(HTTP >= 400 或可解析的业务状态码非 0000)、慢请求及写操作始终记录,
+    未能解析业务状态码的响应(非 JSON、超出采集上限)按采样率处理, 被采样丢弃的请求只计数
+    """
+
+    MUTATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+    NON_ERROR_CODES = frozenset({"0000", "-1"})
+
+    def __init__(self, rates: dict[str, float] | None = None, default_rate: float = 1.0, slow_ms: int = 1000):
+        # 按前缀长度降序排列, 保证最长前缀优先匹配
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.default_rate = default_rate
+        self.slow_seconds = slow_ms / 1000
+        self.counters: dict[str, dict[str, int]] = {}
+
+    def _match(self, path: str) -> tuple[str, float]:
+        for prefix, rate in self.rates:
+            if path.startswith(prefix):
+                return prefix, rate
+        return "*", self.default_rate
+
+    def should_keep(
+        self, method: str, path: str, status_code: int, response_code: str, process_time: float | None
+    ) -> bool:
+        """
+        判断请求是否需要记录API日志
+
+        Args:
+            method: 请求方法
+            path: 请求路径
+            status_code: HTTP 状态码
+            response_code: 业务状态码, "0000" 表示成功, "-1" 表示未能解析
+            process_time: 请求处理耗时(秒)
+
+        Returns:
+            bool: 是否记录
+        """
+        prefix, rate = self._match(path)
+        counter = self.counters.setdefault(prefix, {"seen": 0, "kept": 0, "sampled_out": 0})
+        counter["seen"] += 1
+
+        keep = (
+            method in self.MUTATING_METHODS
+            or status_code >= 400
+            # -1 表示非 JSON 或超出采集上限的响应, 未能解析出业务状态码, 只按 HTTP 状态码判断
+            or response_code not in self.NON_ERROR_CODES
+            or (process_time is not None and process_time >= self.slow_seconds)
+            or rate >= 1
+            or random.random() < rate
+        )
+        counter["kept" if keep else "sampled_out"] += 1
+        return keep
+
+    def get_stats(self) -> dict[str, Any]:
+        return {"default_rate": self.default_rate, "rates": dict(self.rates), "counters": self.counters}
+
+
+audit_log_writer = AuditLogWriter(
+    flush_interval_ms=APP_SETTINGS.get("AUDIT_LOG_FLUSH_INTERVAL_MS", 200),
+    batch_size=APP_SETTINGS.get("AUDIT_LOG_BATCH_SIZE", 500),
+    max_queue=APP_SETTINGS.get("AUDIT_LOG_QUEUE_SIZE", 10000),
+    overflow_policy=APP_SETTINGS.get("AUDIT_LOG_OVERFLOW_POLICY", "drop_new"),
+    spool=(
+        AuditSpool(
+            root=APP_SETTINGS.get("AUDIT_LOG_SPOOL_ROOT", "logs/audit_spool"),
+            max_bytes=APP_SETTINGS.get("AUDIT_LOG_SPOOL_MAX_MB", 1024) * 1024 * 1024,
+        )
+        if APP_SETTINGS.get("AUDIT_LOG_SPOOL_MAX_MB", 1024) > 0
+        else None
+    ),
+)
+
+api_log_sampler = APILogSampler(
+    rates=dict(APP_SETTINGS.get("API_LOG_SAMPLE_RATES", {})),
+    default_rate=APP_SETTINGS.get("API_LOG_SAMPLE_DEFAULT_RATE", 1.0),
+    slow_ms=APP_SETTINGS.get("API_LOG_SLOW_THRESHOLD_MS", 1000),
+)
@@ -1,24 +1,167 @@
+import base64
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime
+from enum import Enum
 from typing import Any
 
+import orjson
 from pydantic import BaseModel
-from tortoise.expressions import Q
+from tortoise.expressions import Q, RawSQL
 from tortoise.models import Model
+from tortoise.queryset import QuerySet
 
-Total = int
+from app.core.constants import ErrorCode
+from app.core.exceptions import HTTPException
+from app.configs import APP_SETTINGS
+
+
+class Total(int):
+    """
+    分页总数, exact 为 False 时表示按上限截断或估算得到的近似值。
+    """
+
+    def __new__(cls, value: int, exact: bool = True) -> Total:
+        obj = super().__new__(cls, value)
+        obj.exact = exact
+        return obj
+
+
+class CountStrategy(str, Enum):
+    """
+    分页总数的计算方式
+
+    - exact: 精确 COUNT
+    - capped: 最多数到 LIST_COUNT_CAP 行, 超出时返回上限并标记为非精确 ("10,000+")
+    - estimated: 由数据库执行计划(表统计信息)估算, 不支持的数据库退回精确计数
+    - cached: 按查询语句缓存精确计数 LIST_COUNT_CACHE_TTL 秒
+    - window: 与当前页在同一条查询中以 COUNT(*) OVER() 取得, 游标分页及 distinct 查询退回精确计数
+    """
+
+    exact = "exact"
+    capped = "capped"
+    estimated = "estimated"
+    cached = "cached"
+    window = "window"
+
+
+# 窗口计数附加到每行的字段名
+WINDOW_TOTAL_FIELD = "_window_total"
+# cached 策略的进程内缓存: 查询语句摘要 -> (过期时间, 总数)
+_count_cache: OrderedDict[str, tuple[float, int]] = OrderedDict()
+_COUNT_CACHE_MAXSIZE = 1024
+
+
+def list_count_strategy(name: str) -> CountStrategy:
+    """读取列表接口配置的总数计算方式, 未配置时为精确计数"""
+    return CountStrategy(APP_SETTINGS.get("LIST_COUNT_STRATEGIES", {}).get(name, CountStrategy.exact))
+
+
+def keyset_order(order: Sequence[str] | None, pk: str = "id") -> list[str]:
+    """
+    游标分页的排序字段, 未包含主键时追加主键保证排序唯一, 方向与最后一个排序字段一致
+
+    参数:
+    - order: 排序字段列表，例: ["-create_time", "-id"]。
+    - pk: 主键字段名。
+
+    返回:
+    - list[str]: 以主键结尾的排序字段列表。
+    """
+    order = list(order or [])
+    if not any(field.lstrip("-") == pk for field in order):
+        order.append(f"-{pk}" if order and order[-1].startswith("-") else pk)
+    return order
+
+
+def keyset_filter(order: list[str], values: list[Any]) -> Q:
+    """
+    构建位于游标之后的行的过滤条件
+
+    对排序 (a, -b, c) 及游标值 (va, vb, vc) 生成:
+    a > va OR (a = va AND b < vb) OR (a = va AND b = vb AND c > vc)
+    """
+    branches = []
+    equal: dict[str, Any] = {}
+    for field, value in zip(order, values):
+        name = field.lstrip("-")
+        lookup = f"{name}__lt" if field.startswith("-") else f"{name}__gt"
+        branches.append(Q(**equal, **{lookup: value}))
+        equal[name] = value
+    return Q(*branches, join_type=Q.OR)
+
+
+def prefix_filter(field: str, prefix: str) -> Q:
+    """
+    构建可使用索引的前缀匹配条件
+
+    Tortoise 的 __startswith 会对字段做 CAST, 数据库无法使用该字段上的索引, 因此先以
+    [prefix, prefix 末字符加一) 的范围条件缩小到索引区间, 再以 LIKE 精确匹配
+    """
+    q = Q(**{f"{field}__gte": prefix, f"{field}__startswith": prefix})
+    if prefix and (last := ord(prefix[-1])) < 0x10FFFF:
+        q &= Q(**{f"{field}__lt": prefix[:-1] + chr(last + 1)})
+    return q
+
+
+def encode_cursor(order: list[str], row: Model | dict[str, Any]) -> str:
+    """
+    由当前页最后一行生成游标, 游标对客户端不透明
+
+    参数:
+    - order: keyset_order 返回的排序字段列表。
+    - row: 模型实例或 values() 返回的行。
+
+    返回:
+    - str: base64url 编码的游标。
+    """
+    values = []
+    for field in order:
+        name = field.lstrip("-")
+        value = row[name] if isinstance(row, dict) else getattr(row, name)
+        values.append({"$dt": value.isoformat()} if isinstance(value, datetime) else value)
+    return base64.urlsafe_b64encode(orjson.dumps([order, values])).decode()
+
+
+def decode_cursor(order: list[str], cursor: str) -> list[Any]:
+    """
+    解析游标, 游标与排序字段不匹配或被篡改时抛出参数错误
+
+    参数:
+    - order: keyset_order 返回的排序字段列表。
+    - cursor: encode_cursor 生成的游标。
+
+    返回:
+    - list[Any]: 各排序字段的游标值。
+    """
+    try:
+        cursor_order, values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_order != order or len(values) != len(order):
+            raise ValueError("cursor order mismatch")
+        return [
+            datetime.fromisoformat(value["$dt"]) if isinstance(value, dict) and "$dt" in value else value
+            for value in values
+        ]
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(code=ErrorCode.PARAM_ERROR, msg="Invalid cursor") from e
 
 
 class CRUDBase[ModelType: Model, CreateSchemaType: BaseModel, UpdateSchemaType: BaseModel]:
-    def __init__(self, model: type[ModelType]):
+    def __init__(self, model: type[ModelType], count_strategy: CountStrategy = CountStrategy.exact):
         """
         初始化通用 CRUD 基类。
 
         参数:
         - model: 具体的 TortoiseORM 模型类型，用于执行数据库操作。
+        - count_strategy: list 默认的总数计算方式。
 
         返回:
         - None：仅保存模型类型以供后续方法使用。
         """
         self.model = model
+        self.count_strategy = count_strategy
 
     async def get(self, *args: Q, **kwargs) -> ModelType:
         """
@@ -41,9 +184,10 @@ class CRUDBase[ModelType: Model, CreateSchemaType: BaseModel, UpdateSchemaType:
         order: list[str] | None = None,
         fields: list[str] | None = None,
         last_id: int | None = None,
-        count_by_pk_field: bool = False,
         prefetch: list[str] | None = None,
         distinct: bool = False,
+        cursor: str | None = None,
+        count: CountStrategy | str | None = None,
     ) -> tuple[Total, list[ModelType]]:
         """
         分页查询模型列表，支持搜索、排序与字段裁剪。
@@ -55,9 +199,11 @@ class CRUDBase[ModelType: Model, CreateSchemaType: BaseModel, UpdateSchemaType:
         - order: 排序字段列表，例: ["id", "-created_at"]。
         - fields: 仅返回的字段列表，减少载荷。
         - last_id: 若提供则按增量方式拉取大于该ID的数据。
-        - count_by_pk_field: 是否按主键去重计数（针对 distinct 复杂场景）。
         - prefetch: 需要预加载的关联字段列表。
         - distinct: 是否执行 distinct 去重（默认 False，避免 JSON 字段排序警告及性能损耗）。
+        - cursor: 不为 None 时使用游标分页，忽略 page；空字符串表示第一页，之后传入 next_cursor 返回的游标。
+          排序末尾自动追加主键，支持降序及多列排序。
+        - count: 总数的计算方式，见 CountStrategy，默认为 count_strategy。
 
         返回:
         - (Total, list[ModelType]): 总数与当前页数据列表。
@@ -65,6 +211,7 @@ class CRUDBase[ModelType: Model, CreateSchemaType: BaseModel, UpdateSchemaType:
         order = order or []
         page = page or 1
         page_size = page_size or 10
+        count = count or self.count_strategy
 
         query = self.model.filter(search)
         if distinct:
@@ -79,18 +226,128 @@ class CRUDBase[ModelType: Model, CreateSchemaType: BaseModel, UpdateSchemaType:
         if fields:
             query = query.only(*fields)
 
-        if count_by_pk_field:
-            # 优化：使用数据库层面的去重计数，避免全量加载到内存
-            total = await query.count()
-        else:
+        if last_id and cursor is None:
+            return await self.count(query, count), await query.order_by(*order).limit(page_size)
+
+        page_query = self.paginate(query, page, page_size, order, cursor)
+        if self.use_window_count(count, cursor, distinct):
+            result = await page_query.annotate(**{WINDOW_TOTAL_FIELD: RawSQL("COUNT(*) OVER()")})
+            total = getattr(result[0], WINDOW_TOTAL_FIELD) if result else None
+            return await self.window_total(query, total, page), result
+
+        return await self.count(query, count), await page_query
+
+    @staticmethod
+    def use_window_count(count: CountStrategy | str, cursor: str | None, distinct: bool = False) -> bool:
+        """
+        是否在分页查询中附带窗口计数。游标分页的查询只包含游标之后的行, distinct 在窗口计数之后执行,
+        两者的窗口计数都不是总数。
+        """
+        return count == CountStrategy.window and cursor is None and not distinct
+
+    async def window_total(self, query: QuerySet, total: int | None, page: int) -> Total:
+        """
+        由分页查询中取得的窗口计数得到总数, 当前页为空时窗口计数不可用, 第一页为空即总数为 0,
+        否则退回精确计数。
+        """
+        if total is not None:
+            return Total(total)
+        return Total(0) if page <= 1 else await self.count(query, CountStrategy.exact)
+
+    async def count(self, query: QuerySet, strategy: CountStrategy | str = CountStrategy.exact) -> Total:
+        """
+        按指定方式计算查询的总数。
+
+        参数:
+        - query: 已应用过滤条件、未分页的查询。
+        - strategy: 计算方式，见 CountStrategy；window 在此处按精确计数处理。
+
+        返回:
+        - Total: 总数，近似值的 exact 为 False。
+        """
+        if strategy == CountStrategy.capped:
+            cap = APP_SETTINGS.get("LIST_COUNT_CAP", 10000)
+            # 只取到上限 + 1 行的主键, 代价与总行数无关
+            rows = await query.limit(cap + 1).values_list(self.model._meta.pk_attr, flat=True)
+            return Total(cap, exact=False) if len(rows) > cap else Total(len(rows))
+
+        if strategy == CountStrategy.estimated:
+            if (estimate := await self._estimate(query)) is not None:
+                return Total(estimate, exact=False)
+            return Total(await query.count())
+
+        if strategy == CountStrategy.cached:
+            key = hashlib.blake2b(query.sql(params_inline=True).encode(), digest_size=16).hexdigest()
+            now = time.monotonic()
+            if (entry := _count_cache.get(key)) is not None and entry[0] > now:
+                _count_cache.move_to_end(key)
+                return Total(entry[1])
             total = await query.count()
+            _count_cache[key] = (now + APP_SETTINGS.get("LIST_COUNT_CACHE_TTL", 30), total)
+            _count_cache.move_to_end(key)
+            if len(_count_cache) > _COUNT_CACHE_MAXSIZE:
+                _count_cache.popitem(last=False)
+            return Total(total)
 
-        if last_id:
-            result = await query.order_by(*order).limit(page_size)
-        else:
-            result = await query.offset((page - 1) * page_size).limit(page_size).order_by(*order)
+        return Total(await query.count())
+
+    async def _estimate(self, query: QuerySet) -> int | None:
+        """由执行计划估算查询的行数, 不支持的数据库返回 None"""
+        db = self.model._meta.db
+        sql = query.sql(params_inline=True)
+        dialect = db.capabilities.dialect
+        if dialect == "mysql":
+            rows = await db.execute_query_dict(f"EXPLAIN {sql}")
+            # 驱动表的预计扫描行数乘以条件过滤比例
+            return int((rows[0]["rows"] or 0) * float(rows[0].get("filtered") or 100) / 100) if rows else None
+        if dialect == "postgres":
+            rows = await db.execute_query_dict(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = rows[0]["QUERY PLAN"]
+            plan = orjson.loads(plan) if isinstance(plan, str) else plan
+            return int(plan[0]["Plan"]["Plan Rows"])
+        return None
+
+    def paginate(
+        self, query: QuerySet, page: int, page_size: int, order: Sequence[str], cursor: str | None = None
+    ) -> QuerySet:
+        """
+        截取一页数据的查询, 游标模式下以 keyset 条件代替 OFFSET, 深分页的代价与页码无关。
+
+        参数:
+        - query: 已应用过滤条件的查询。
+        - page: 页码，游标模式下忽略。
+        - page_size: 每页数量。
+        - order: 排序字段列表。
+        - cursor: 游标，None 表示按页码分页，空字符串表示游标模式的第一页。
+
+        返回:
+        - QuerySet: 排序并截取后的查询。
+        """
+        if cursor is None:
+            return query.offset((page - 1) * page_size).limit(page_size).order_by(*order)
+
+        order = keyset_order(order, self.model._meta.pk_attr)
+        if cursor:
+            query = query.filter(keyset_filter(order, decode_cursor(order, cursor)))
+        return query.order_by(*order).limit(page_size)
+
+    def next_cursor(
+        self, rows: Sequence[ModelType] | Sequence[dict[str, Any]], page_size: int, order: Sequence[str]
+    ) -> str | None:
+        """
+        游标模式下一页的游标, 当前页不满时表示已无数据, 返回 None。
 
-        return Total(total), result
+        参数:
+        - rows: 当前页数据，模型实例或 values() 返回的行。
+        - page_size: 每页数量。
+        - order: 与查询时相同的排序字段列表。
+
+        返回:
+        - str | None: 下一页游标。
+        """
+        if len(rows) < (page_size or 10):
+            return None
+        return encode_cursor(keyset_order(order, self.model._meta.pk_attr), rows[-1])
 
     async def create(self, obj_in: CreateSchemaType, exclude: set[str] | None = None) -> ModelType:
         """
@@ -1,3 +1,6 @@
+import hashlib
+import time
+from collections import OrderedDict
 from typing import Any
 
 import jwt
@@ -7,9 +10,9 @@ from fastapi.security import OAuth2PasswordBearer
 from app.core.ctx import CTX_USER_ID, CTX_X_REQUEST_ID
 from app.core.exceptions import HTTPException
 from app.log import log
-from app.models.system import User, StatusType
+from app.core.permission import PermissionDecision, api_index, permission_cache
+from app.core.principal import Principal, principal_cache
 from app.configs import APP_SETTINGS
-from app.utils.tools import check_url
 
 # OAuth2 认证方案
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False)
@@ -29,24 +32,85 @@ def _decode_token(token: str, secret_key: str, algorithm: str) -> tuple[bool, in
         return False, 5000, f"{repr(e)}"
 
 
+class TokenCache:
+    """
+    已验签令牌缓存
+    以令牌摘要为键缓存解码结果, 按 LRU 淘汰并在令牌 exp 到期时失效,
+    同一令牌在每个进程内只需验签一次
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._secret_key: str | None = None
+        self._algorithm: str | None = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _settings(self) -> tuple[str, str]:
+        # 密钥与算法只读取一次, 避免每次解码都经过 ConfigProxy 查找
+        if self._secret_key is None or self._algorithm is None:
+            self._secret_key = str(APP_SETTINGS.SECRET_KEY)
+            self._algorithm = str(APP_SETTINGS.JWT_ALGORITHM)
+        return self._secret_key, self._algorithm
+
+    def check(self, token: str) -> tuple[bool, int, Any]:
+        """检查令牌, 命中缓存时跳过验签"""
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, 0, entry[1]
+            # 令牌已过期, 移除后交由 jwt.decode 给出过期错误
+            del self._entries[key]
+            self.stats["expired"] += 1
+
+        self.stats["misses"] += 1
+        status, code, decode_data = _decode_token(token, *self._settings())
+        if status and isinstance(decode_data, dict) and "exp" in decode_data:
+            self._entries[key] = (float(decode_data["exp"]), decode_data)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return status, code, decode_data
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._secret_key = self._algorithm = None
+
+    def get_stats(self) -> dict[str, Any]:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hit_rate_percent": round(self.stats["hits"] / total * 100, 2) if total else 0.0,
+        }
+
+
+token_cache = TokenCache(maxsize=APP_SETTINGS.get("TOKEN_CACHE_SIZE", 4096))
+
+
 def check_token(token: str) -> tuple[bool, int, Any]:
     """检查token有效性"""
-    return _decode_token(token, APP_SETTINGS.SECRET_KEY, APP_SETTINGS.JWT_ALGORITHM)
+    return token_cache.check(token)
 
 
 class AuthControl:
     """认证控制器"""
 
     @classmethod
-    async def is_authed(cls, token: str = Depends(oauth2_schema)) -> User:
+    async def is_authed(cls, token: str = Depends(oauth2_schema)) -> Principal:
         """
         验证用户认证状态
+        身份取自进程内的身份快照缓存; 快照缺失时, 令牌携带的权限戳仍为最新则直接由令牌构建, 否则查询数据库
 
         Args:
             token: JWT token
 
         Returns:
-            User: 认证用户对象
+            Principal: 认证用户身份
 
         Raises:
             HTTPException: 认证失败时抛出异常
@@ -54,31 +118,27 @@ class AuthControl:
         if not token:
             raise HTTPException(code="4001", msg="Authentication failed, token does not exists in the request.")
 
-        # 从上下文获取用户ID（如果已设置）
-        user_id = CTX_USER_ID.get()
-        if user_id == 0:
-            status, code, decode_data = check_token(token)
-            if not status:
-                raise HTTPException(code=code, msg=decode_data)
-
-            if decode_data["data"]["tokenType"] != "accessToken":
-                raise HTTPException(code="4040", msg="The token is not an access token")
+        status, code, decode_data = check_token(token)
+        if not status:
+            raise HTTPException(code=code, msg=decode_data)
 
-            user_id = decode_data["data"]["userId"]
+        claims: dict[str, Any] = decode_data["data"]
+        if claims["tokenType"] != "accessToken":
+            raise HTTPException(code="4040", msg="The token is not an access token")
 
-        # 查询用户信息
-        user = await User.filter(id=user_id).first()
-        if not user:
+        user_id = int(claims["userId"])
+        principal = await principal_cache.load(user_id, claims)
+        if principal is None:
             raise HTTPException(
                 code="4040", msg=f"Authentication failed, the user_id: {user_id} does not exists in the system."
             )
 
         # 设置上下文用户ID
-        CTX_USER_ID.set(int(user_id))
-        return user
+        CTX_USER_ID.set(user_id)
+        return principal
 
     @classmethod
-    async def get_current_user_optional(cls, token: str = Depends(oauth2_schema)) -> User | None:
+    async def get_current_user_optional(cls, token: str = Depends(oauth2_schema)) -> Principal | None:
         """
         获取当前用户（可选）
 
@@ -86,7 +146,7 @@ class AuthControl:
             token: JWT token
 
         Returns:
-            Optional[User]: 用户对象或None
+            Optional[Principal]: 用户身份或None
         """
         try:
             return await cls.is_authed(token)
@@ -98,7 +158,9 @@ class PermissionControl:
     """权限控制器"""
 
     @classmethod
-    async def has_permission(cls, request: Request, current_user: User = Depends(AuthControl.is_authed)) -> None:
+    async def has_permission(
+        cls, request: Request, current_user: Principal = Depends(AuthControl.is_authed)
+    ) -> Principal:
         """
         检查用户权限
 
@@ -106,33 +168,37 @@ class PermissionControl:
             request: FastAPI请求对象
             current_user: 当前认证用户
 
+        Returns:
+            Principal: 当前认证用户
+
         Raises:
             HTTPException: 权限不足时抛出异常
         """
-        # 预加载用户角色及其关联的API
-        await current_user.fetch_related("by_user_roles__by_role_apis")
-        user_roles_codes: list[str] = [r.role_code for r in current_user.by_user_roles]
+        user_roles_codes = current_user.role_codes
 
         # 超级管理员直接通过
-        if "R_SUPER" in user_roles_codes:
-            return
+        if current_user.is_super:
+            return current_user
 
-        if not current_user.by_user_roles:
+        if not user_roles_codes:
             raise HTTPException(code="4040", msg="The user is not bound to a role")
 
         method = request.method.lower()
         path = request.url.path
 
-        # 获取用户所有API权限
-        apis = [role.by_role_apis for role in current_user.by_user_roles]
-        permission_apis = list(set((api.api_method.value, api.api_path, api.status_type) for api in sum(apis, [])))
+        # 使用 FastAPI 已匹配的路由模板定位 API, 无需逐条正则匹配
+        route = request.scope.get("route")
+        path_format = getattr(route, "path_format", path)
+
+        # 未登记的路由直接拒绝, 不触发重建; 索引仅在 Api 变更或授权版本变化时失效重建
+        api_id = await api_index.get_api_id(method, path_format)
 
-        # 检查权限
-        for api_method, api_path, api_status in permission_apis:
-            if api_method == method and check_url(api_path, request.url.path):
-                if api_status == StatusType.disable:
-                    raise HTTPException(code="4031", msg=f"The API has been disabled, method: {method} path: {path}")
-                return
+        if api_id is not None:
+            decision = await permission_cache.get_decision(user_roles_codes, api_id)
+            if decision == PermissionDecision.disabled:
+                raise HTTPException(code="4031", msg=f"The API has been disabled, method: {method} path: {path}")
+            if decision == PermissionDecision.allow:
+                return current_user
 
         # 权限检查失败，记录日志
         log.error("*" * 20)
@@ -18,11 +18,7 @@ from app.core.exceptions import (
     ResponseValidationError,
     ResponseValidationHandle,
 )
-from app.core.middlewares import (
-    APILoggerAddResponseMiddleware,
-    APILoggerMiddleware,
-    BackGroundTaskMiddleware,
-)
+from app.core.middlewares import RequestPipelineMiddleware
 from app.db.seeds.initial_data import init_menus, init_users
 
 
@@ -42,12 +38,8 @@ def make_middlewares():
             # 优化CORS配置
             max_age=600,  # 预检请求缓存时间
         ),
-        # 后台任务中间件
-        Middleware(BackGroundTaskMiddleware),
-        # API日志中间件
-        Middleware(APILoggerMiddleware),
-        # API响应日志中间件
-        Middleware(APILoggerAddResponseMiddleware),
+        # 请求处理管线: 请求ID、后台任务及API日志采集
+        Middleware(RequestPipelineMiddleware),
     ]
     return middleware
 
@@ -1,277 +1,271 @@
 from uuid import uuid4
+from dataclasses import dataclass, field
 from datetime import datetime
 from json import JSONDecodeError
 from typing import Any
 
 import orjson
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-from starlette.responses import Response
-from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.core.audit import api_log_sampler, audit_log_writer
 from app.core.bgtask import BgTasks
 from app.core.ctx import CTX_X_REQUEST_ID, CTX_USER_ID
 from app.core.dependency import check_token
-from app.core.exceptions import HTTPException
+from app.core.redact import log_redactor
+from app.core.rollup import api_rollup_writer
 from app.models.system import LogType
-from app.models.system import User, Log, APILog
 from app.configs import APP_SETTINGS
 from app.log import log
 
+# 不记录请求体及响应体的路径前缀
+SENSITIVE_PATH_PREFIXES = ("/api/v1/auth/login", "/api/v1/auth/refresh-token")
+# 请求体及响应体的最大记录字节数
+MAX_LOG_BODY_BYTES = log_redactor.max_bytes
 
-class SimpleBaseMiddleware:
+
+def parse_request_data(raw_body: bytes | bytearray | None, body_len: int) -> dict[str, Any] | None:
+    """解析并脱敏请求体"""
+    if not body_len:
+        return None
+    if body_len > MAX_LOG_BODY_BYTES:
+        return {"_truncated": True, "len": body_len}
+    if raw_body is None:
+        return None
+    try:
+        data = log_redactor.loads(raw_body)
+    except (JSONDecodeError, orjson.JSONDecodeError, UnicodeDecodeError, ValueError):
+        return None
+    if isinstance(data, dict):
+        return data
+    return {"_non_dict": True}
+
+
+def parse_response_data(
+    response_body: bytes | bytearray | None, body_len: int, is_sensitive: bool
+) -> tuple[str, Any | None]:
+    """解析响应体, 返回业务状态码及脱敏后的响应数据"""
+    if is_sensitive:
+        return "-1", None
+    if body_len > MAX_LOG_BODY_BYTES:
+        return "-1", {"_truncated": True, "len": body_len}
+    if not response_body:
+        return "-1", None
+
+    try:
+        resp_data = log_redactor.loads(response_body)
+    except (orjson.JSONDecodeError, UnicodeDecodeError):
+        return "-1", None
+    if not isinstance(resp_data, dict):
+        return "-1", None
+    return str(resp_data.get("code", "-1")), resp_data
+
+
+def should_log_request(path: str) -> bool:
+    """判断是否应该记录请求日志"""
+    # 检查排除列表
+    if any(exclude in path for exclude in APP_SETTINGS.ADD_LOG_ORIGINS_DECLUDE):
+        return False
+
+    # 检查包含列表
+    if "*" in APP_SETTINGS.ADD_LOG_ORIGINS_INCLUDE:
+        return True
+
+    return any(include in path for include in APP_SETTINGS.ADD_LOG_ORIGINS_INCLUDE)
+
+
+def get_route_path(scope: Scope) -> str | None:
+    """请求匹配的路由模板, 如 /api/v1/system-manage/users/{user_id}, 未匹配到路由时为 None"""
+    route = scope.get("route")
+    return getattr(route, "path_format", None)
+
+
+def get_user_id_from_token(authorization: str) -> int | None:
+    """从token获取用户ID，避免数据库查询"""
+    try:
+        status, _, decode_data = check_token(authorization.replace("Bearer ", "", 1))
+        if status and decode_data:
+            user_id = int(decode_data["data"]["userId"])
+            CTX_USER_ID.set(user_id)
+            return user_id
+    except Exception as e:
+        # 记录异常，但不阻断请求
+        log.warning(f"Failed to decode token in middleware: {e}")
+    return None
+
+
+@dataclass(slots=True)
+class _BodyBuffer:
     """
-    简化的基础中间件类
-    提供更好的性能和错误处理
+    有界的消息体缓冲
+    只保留前 limit 字节, 超出后释放已缓冲的内容且不再复制, 之后只累计长度
     """
 
-    def __init__(self, app: ASGIApp) -> None:
-        self.app = app
+    limit: int = MAX_LOG_BODY_BYTES
+    data: bytearray = field(default_factory=bytearray)
+    length: int = 0
+    capturing: bool = True
 
-    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
+    @property
+    def truncated(self) -> bool:
+        return self.length > self.limit
+
+    def add(self, chunk: bytes) -> None:
+        self.length += len(chunk)
+        if not self.capturing:
             return
+        if self.length > self.limit:
+            self.stop()
+            return
+        self.data += chunk
 
-        await self.handle_http(scope, receive, send)
+    def stop(self) -> None:
+        """停止复制并释放已缓冲的内容"""
+        self.capturing = False
+        self.data = bytearray()
 
-    async def handle_http(self, scope: Scope, receive: Receive, send: Send) -> None:
-        request = Request(scope, receive)
-        response = await self.before_request(request) or self.app
+    def get(self) -> bytearray | None:
+        return self.data if self.capturing else None
 
-        async def send_wrapper(message: dict[str, Any]) -> None:
-            await self.after_request(request, message)
-            await send(message)
 
-        await response(scope, receive, send_wrapper)
+@dataclass(slots=True)
+class _Capture:
+    """单个请求采集到的请求体及响应体"""
 
-    async def before_request(self, request: Request) -> ASGIApp | None:
-        """请求前处理"""
-        return None
+    enabled: bool
+    status_code: int = 500
+    request: _BodyBuffer = field(default_factory=_BodyBuffer)
+    response: _BodyBuffer = field(default_factory=_BodyBuffer)
+    response_complete: bool = False
 
-    async def after_request(self, request: Request, message: dict[str, Any]) -> None:
-        """请求后处理"""
-        pass
+    def start_response(self, message: Message) -> None:
+        """根据响应头决定是否复制响应体: 非 JSON 响应(文件、流式等)及声明长度超过上限的响应只计长度"""
+        self.status_code = message["status"]
+        for name, value in message.get("headers", ()):
+            name = name.lower()
+            if name == b"content-type" and b"json" not in value:
+                self.response.stop()
+            elif name == b"content-length" and value.isdigit() and int(value) > self.response.limit:
+                self.response.stop()
 
 
-class BackGroundTaskMiddleware(SimpleBaseMiddleware):
+class RequestPipelineMiddleware:
     """
-    后台任务中间件
-    优化任务执行和错误处理
+    请求处理管线中间件 (纯 ASGI)
+    在一次调用中完成请求ID、后台任务、请求体分流采集及响应采集, 取代原有的
+    BackGroundTaskMiddleware + APILoggerMiddleware + APILoggerAddResponseMiddleware 的叠加:
+    - 不经过 BaseHTTPMiddleware, 没有额外的任务及内存流转发
+    - 请求体在下游读取时同步采集, 不预先 request.body() 缓冲
+    - 请求体及响应体按块复制到有界缓冲, 超过上限后不再复制, 大响应及流式响应的内存占用为常量
+    - 最后一个响应块发送后执行后台任务, 并将完整的API日志放入批量写入队列, 只写入一次
     """
 
-    async def before_request(self, request: Request) -> ASGIApp | None:
-        try:
-            await BgTasks.init_bg_tasks_obj()
-        except Exception as e:
-            log.warning(f"Failed to initialize background tasks: {e!r}")
-        return None
-
-    async def after_request(self, request: Request, message: dict[str, Any]) -> None:
-        try:
-            await BgTasks.execute_tasks()
-        except Exception as e:
-            log.warning(f"Failed to execute background tasks: {e!r}")
-
+    excluded_paths = frozenset({"/health", "/metrics", "/favicon.ico"})
+    body_methods = frozenset({"POST", "PUT", "PATCH"})
 
-class APILoggerMiddleware(BaseHTTPMiddleware):
-    """
-    API日志中间件
-    优化日志记录性能和错误处理
-    """
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
 
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.excluded_paths = {"/health", "/metrics", "/favicon.ico"}
-        self.sensitive_path_prefixes = (
-            "/api/v1/auth/login",
-            "/api/v1/auth/refresh-token",
-        )
-        self.max_body_bytes = 32 * 1024
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        # 设置请求开始时间和ID
-        request.state.start_time = datetime.now()
+        start_time = datetime.now()
         x_request_id = uuid4().hex
+        x_request_id_header = (b"x-request-id", x_request_id.encode())
         CTX_X_REQUEST_ID.set(x_request_id)
-        request.state.x_request_id = x_request_id
-
-        path = request.url.path
-
-        # 跳过不需要记录的路径
-        if path in self.excluded_paths:
-            return await call_next(request)
-
-        # 检查是否需要记录日志
-        should_log = self._should_log_request(path)
-
-        if should_log and request.scope["type"] == "http":
-            try:
-                await self._create_api_log(request, x_request_id)
-            except Exception as e:
-                log.warning(f"Failed to create API log: {e!r}")
-
-        response = await call_next(request)
-        return response
-
-    def _should_log_request(self, path: str) -> bool:
-        """判断是否应该记录请求日志"""
-        # 检查排除列表
-        if any(exclude in path for exclude in APP_SETTINGS.ADD_LOG_ORIGINS_DECLUDE):
-            return False
-
-        # 检查包含列表
-        if "*" in APP_SETTINGS.ADD_LOG_ORIGINS_INCLUDE:
-            return True
+        state = scope.setdefault("state", {})
+        state["start_time"] = start_time
+        state["x_request_id"] = x_request_id
 
-        return any(include in path for include in APP_SETTINGS.ADD_LOG_ORIGINS_INCLUDE)
-
-    async def _get_user_id_from_token(self, token: str) -> int | None:
-        """从token获取用户ID，避免数据库查询"""
         try:
-            status, _, decode_data = check_token(token.replace("Bearer ", "", 1))
-            if status and decode_data:
-                user_id = int(decode_data["data"]["userId"])
-                CTX_USER_ID.set(user_id)
-                return user_id
+            await BgTasks.init_bg_tasks_obj()
         except Exception as e:
-            # 记录异常，但不阻断请求
-            from loguru import logger
-            logger.warning(f"Failed to decode token in middleware: {e}")
-        return None
+            log.warning(f"Failed to initialize background tasks: {e!r}")
 
-    def _is_sensitive_path(self, path: str) -> bool:
-        return path.startswith(self.sensitive_path_prefixes)
-
-    def _sanitize(self, obj: Any) -> Any:
-        if isinstance(obj, dict):
-            redacted_keys = {
-                "password",
-                "token",
-                "refreshToken",
-                "refresh_token",
-                "accessToken",
-                "access_token",
-                "authorization",
-                "cookie",
-            }
-            return {
-                k: ("***" if k in redacted_keys else self._sanitize(v))
-                for k, v in obj.items()
-            }
-        if isinstance(obj, list):
-            return [self._sanitize(v) for v in obj]
-        return obj
+        path: str = scope["path"]
+        capture = _Capture(enabled=path not in self.excluded_paths and len(path) <= 500 and should_log_request(path))
+        capture_body = (
+            capture.enabled and scope["method"] in self.body_methods and not path.startswith(SENSITIVE_PATH_PREFIXES)
+        )
+        finished = False
+
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                capture.request.add(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal finished
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append(x_request_id_header)
+                capture.start_response(message)
+            elif message["type"] == "http.response.body" and capture.enabled:
+                capture.response.add(message.get("body", b""))
+
+            await send(message)
 
-    async def _get_request_data(self, request: Request) -> dict[str, Any] | None:
-        """安全地获取请求数据"""
-        if request.method not in ["POST", "PUT", "PATCH"]:
-            return None
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finished = True
+                capture.response_complete = True
+                await self._finish(scope, start_time, capture)
 
         try:
-            if self._is_sensitive_path(request.url.path):
-                return None
-
-            raw_body = await request.body()
-            if not raw_body:
-                return None
-            if len(raw_body) > self.max_body_bytes:
-                return {"_truncated": True, "len": len(raw_body)}
-
-            data = orjson.loads(raw_body)
-            if isinstance(data, dict):
-                return self._sanitize(data)
-            return {"_non_dict": True}
-        except (JSONDecodeError, orjson.JSONDecodeError, UnicodeDecodeError, ValueError):
-            return None
-
-    async def _create_api_log(self, request: Request, x_request_id: str) -> None:
-        """创建API日志记录"""
-        # 获取用户信息
-        token = request.headers.get("Authorization")
-        user_id = None
-        if token:
-            user_id = await self._get_user_id_from_token(token)
-
-        # 获取请求数据
-        request_data = await self._get_request_data(request)
-
-        # 验证URL长度
-        url = str(request.url.path)
-        if len(url) > 500:
-            raise HTTPException(msg="请求url path过长, 请联系开发人员", code="4001")
-
-        # 创建API日志数据
-        api_log_data = {
-            "ip_address": request.client.host if request.client else None,
-            "user_agent": request.headers.get("user-agent"),
-            "request_domain": request.url.hostname,
-            "request_path": request.url.path,
-            "request_params": dict(request.query_params) or None,
-            "request_data": request_data,
-            "x_request_id": x_request_id,
-        }
-
-        # 创建日志记录
-        api_log_obj = await APILog.create(**api_log_data)
-        request.state.api_log_id = api_log_obj.id
-
-        # 创建系统日志
-        await Log.create(log_type=LogType.ApiLog, by_user_id=user_id, api_log=api_log_obj, x_request_id=x_request_id)
-
-
-class APILoggerAddResponseMiddleware(SimpleBaseMiddleware):
-    """
-    API响应日志中间件
-    优化响应数据记录和性能
-    """
-
-    async def after_request(self, request: Request, message: dict[str, Any]) -> None:
-        # 处理响应体
-        if message.get("type") == "http.response.body" and hasattr(request.state, "api_log_id"):
-            await self._update_response_log(request, message)
+            await self.app(scope, receive_wrapper if capture_body else receive, send_wrapper)
+        finally:
+            # 处理过程中抛出异常等未正常发送完响应时, 仍记录请求部分
+            if not finished:
+                finished = True
+                await self._finish(scope, start_time, capture)
+
+    async def _finish(self, scope: Scope, start_time: datetime, capture: _Capture) -> None:
+        """响应发送完成后执行后台任务并写入API日志"""
+        # 处理耗时不含响应后执行的后台任务
+        process_time = (datetime.now() - start_time).total_seconds()
+        try:
+            await BgTasks.execute_tasks()
+        except Exception as e:
+            log.warning(f"Failed to execute background tasks: {e!r}")
 
-        # 添加请求ID到响应头
-        if message.get("type") == "http.response.start" and hasattr(request.state, "x_request_id"):
-            headers = message.setdefault("headers", [])
-            headers.append((b"x-request-id", request.state.x_request_id.encode()))
+        if not capture.enabled:
+            return
 
-    async def _update_response_log(self, request: Request, message: dict[str, Any]) -> None:
-        """更新响应日志"""
         try:
-            response_body = message.get("body", b"")
-            if not response_body:
+            response_code, response_data = parse_response_data(
+                capture.response.get() if capture.response_complete else None,
+                capture.response.length,
+                scope["path"].startswith(SENSITIVE_PATH_PREFIXES),
+            )
+            route_path = get_route_path(scope)
+            api_rollup_writer.record(scope["method"], route_path, response_code, capture.status_code, process_time)
+            # 采样丢弃的请求只计数, 不写入日志
+            if not api_log_sampler.should_keep(
+                scope["method"], scope["path"], capture.status_code, response_code, process_time
+            ):
                 return
 
-            process_time = None
-            if hasattr(request.state, "start_time"):
-                process_time = (datetime.now() - request.state.start_time).total_seconds()
-
-            response_code = "-1"
-            response_data: Any | None = None
-
-            is_sensitive = request.url.path.startswith(("/api/v1/auth/login", "/api/v1/auth/refresh-token"))
-            if not is_sensitive and len(response_body) <= 32 * 1024:
-                try:
-                    resp_data = orjson.loads(response_body)
-                except (orjson.JSONDecodeError, UnicodeDecodeError):
-                    resp_data = None
-
-                if isinstance(resp_data, dict):
-                    response_code = str(resp_data.get("code", "-1"))
-                    redacted = {
-                        k: ("***" if k in {"token", "refreshToken", "access_token", "refresh_token"} else v)
-                        for k, v in resp_data.items()
-                    }
-                    response_data = redacted
-            elif not is_sensitive:
-                response_data = {"_truncated": True, "len": len(response_body)}
-
-            update_data: dict[str, Any] = {"response_code": response_code, "response_data": response_data}
-            if process_time is not None:
-                update_data["process_time"] = process_time
-
-            await APILog.filter(id=request.state.api_log_id).update(**update_data)
-
+            request = Request(scope)
+            token = request.headers.get("Authorization")
+            user_id = get_user_id_from_token(token) if token else None
+            x_request_id = scope["state"]["x_request_id"]
+            api_log_data = {
+                "ip_address": request.client.host if request.client else None,
+                "user_agent": request.headers.get("user-agent"),
+                "request_domain": request.url.hostname,
+                "request_path": scope["path"],
+                "request_method": scope["method"],
+                "route_path": route_path,
+                "request_params": dict(request.query_params) or None,
+                "request_data": parse_request_data(capture.request.get(), capture.request.length),
+                "x_request_id": x_request_id,
+                "response_code": response_code,
+                "response_data": response_data,
+                "process_time": process_time,
+            }
+            await audit_log_writer.add_api_log(
+                api_log_data, {"log_type": LogType.ApiLog, "by_user_id": user_id, "x_request_id": x_request_id}
+            )
         except Exception as e:
-            log.warning(f"Failed to update response log: {e!r}")
+            log.warning(f"Failed to save API log: {e!r}")
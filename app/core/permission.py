@@ -0,0 +1,497 @@
+"""
+权限索引模块
+- 基于 FastAPI 已匹配的路由模板 (method + path_format) 以 O(1) 定位 Api 记录
+- 为 Api / Button / Menu 分配紧凑的位槽, 角色授权以位图存储, 多角色用户按位或合并
+- 基于 Redis 的权限判定缓存, 以角色权限版本号作为键的一部分, 授权变更即时失效
+- 授权或用户变更时经 Redis 发布订阅通知各进程清理用户身份快照
+"""
+
+import asyncio
+import hashlib
+from collections.abc import Callable
+from uuid import uuid4
+from dataclasses import dataclass
+from enum import Enum
+
+from redis.exceptions import RedisError
+from tortoise.expressions import F
+
+from app.core.cache import cache_manager
+from app.log import log
+from app.models.system import Api, Button, Menu, MethodType, Role, StatusType
+
+
+class ApiIndex:
+    """(请求方法, 路由模板) -> Api id 的内存索引"""
+
+    def __init__(self):
+        self._index: dict[tuple[str, str], int] = {}
+        # 每次失效递增, 重建时记录开始重建时的值, 两者相等表示索引有效且此后没有失效
+        self._invalidations = 0
+        self._loaded_invalidations: int | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_invalidations == self._invalidations
+
+    async def ensure_loaded(self) -> None:
+        """索引失效时从 Api 表重建, 并发的调用只重建一次"""
+        if self.loaded:
+            return
+        async with self._lock:
+            # 等待锁期间其他协程可能已完成重建
+            if self.loaded:
+                return
+            invalidations = self._invalidations
+            rows = await Api.all().values_list("id", "api_method", "api_path")
+            self._index = {(MethodType(api_method).value, api_path): api_id for api_id, api_method, api_path in rows}
+            # 重建期间发生的失效使索引仍为失效状态, 下次查询时再次重建
+            self._loaded_invalidations = invalidations
+
+    async def reload(self) -> None:
+        """立即从 Api 表重建索引"""
+        self.invalidate()
+        await self.ensure_loaded()
+
+    def invalidate(self) -> None:
+        """标记索引失效, 下次查询时重建"""
+        self._invalidations += 1
+
+    async def get_api_id(self, method: str, path_format: str) -> int | None:
+        """
+        根据请求方法和路由模板获取 Api id
+
+        Args:
+            method: 请求方法, 如 get
+            path_format: 路由模板, 如 /api/v1/system-manage/roles/{role_id}
+
+        Returns:
+            int | None: Api id, 未登记的路由返回 None
+        """
+        await self.ensure_loaded()
+        return self._index.get((method.lower(), path_format))
+
+
+class PermissionDecision(str, Enum):
+    """API 权限判定结果"""
+
+    allow = "allow"
+    deny = "deny"
+    disabled = "disabled"
+
+
+@dataclass(slots=True, frozen=True)
+class RoleGrants:
+    """角色授权位图, 第 n 位对应槽位 n 的 Api / Button / Menu"""
+
+    apis: int = 0
+    buttons: int = 0
+    menus: int = 0
+
+    def __or__(self, other: RoleGrants) -> RoleGrants:
+        return RoleGrants(self.apis | other.apis, self.buttons | other.buttons, self.menus | other.menus)
+
+
+def iter_bits(bits: int):
+    """按从低到高的顺序迭代位图中被置位的槽位"""
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+class PermissionRegistry:
+    """角色权限位图注册表, 进程内缓存, 授权变更时失效后按需重建"""
+
+    def __init__(self):
+        self.api_slots: dict[int, int] = {}
+        self.disabled_api_bits = 0
+        self.button_codes: list[str] = []
+        self.menu_ids: list[int] = []
+        self.all_grants = RoleGrants()
+        self.role_grants: dict[str, RoleGrants] = {}
+        self.role_versions: dict[str, int] = {}
+        self.role_homes: dict[str, str] = {}
+        # 按角色物化的按钮编码集合, 超级管理员为全部按钮
+        self.role_button_codes: dict[str, tuple[str, ...]] = {}
+        self.all_button_codes: tuple[str, ...] = ()
+        # 每次重建递增, 持有旧位图的调用方据此判断槽位分配是否已变化
+        self.generation = 0
+        # 每次失效递增, 重建时记录开始重建时的值, 两者相等表示注册表有效且此后没有失效
+        self._invalidations = 0
+        self._loaded_invalidations: int | None = None
+        self._lock = asyncio.Lock()
+
+    async def _rebuild(self) -> None:
+        """从数据库重建槽位分配及各角色的授权位图, 调用方需持有锁"""
+        invalidations = self._invalidations
+        # 先读取版本号再读取授权, 期间若有提交则版本号偏旧, 下次比对时会再次重建
+        role_rows = await Role.all().order_by("id").values_list(
+            "role_code", "perm_version", "by_role_home__route_name"
+        )
+        role_versions = {role_code: perm_version for role_code, perm_version, _ in role_rows}
+        api_rows = await Api.all().order_by("id").values_list("id", "status_type")
+        button_rows = await Button.all().order_by("id").values_list("id", "button_code")
+        menu_ids = await Menu.all().order_by("id").values_list("id", flat=True)
+
+        api_slots = {api_id: slot for slot, (api_id, _) in enumerate(api_rows)}
+        button_slots = {button_id: slot for slot, (button_id, _) in enumerate(button_rows)}
+        menu_slots = {menu_id: slot for slot, menu_id in enumerate(menu_ids)}
+
+        disabled_api_bits = 0
+        for api_id, status_type in api_rows:
+            if status_type == StatusType.disable:
+                disabled_api_bits |= 1 << api_slots[api_id]
+
+        role_bits: dict[str, list[int]] = {role_code: [0, 0, 0] for role_code in role_versions}
+        for index, (relation, slots) in enumerate(
+            (("by_role_apis", api_slots), ("by_role_buttons", button_slots), ("by_role_menus", menu_slots))
+        ):
+            for role_code, related_id in await Role.all().values_list("role_code", f"{relation}__id"):
+                if (slot := slots.get(related_id)) is not None and role_code in role_bits:
+                    role_bits[role_code][index] |= 1 << slot
+
+        self.api_slots = api_slots
+        self.disabled_api_bits = disabled_api_bits
+        self.button_codes = [button_code for _, button_code in button_rows]
+        self.menu_ids = list(menu_ids)
+        self.all_grants = RoleGrants(
+            (1 << len(api_slots)) - 1, (1 << len(button_slots)) - 1, (1 << len(menu_slots)) - 1
+        )
+        self.role_grants = {role_code: RoleGrants(*bits) for role_code, bits in role_bits.items()}
+        self.role_versions = role_versions
+        self.role_homes = {role_code: route_name for role_code, _, route_name in role_rows if route_name}
+        self.role_button_codes = {
+            role_code: tuple(self.get_button_codes(role_grant))
+            for role_code, role_grant in self.role_grants.items()
+        }
+        self.all_button_codes = tuple(dict.fromkeys(self.button_codes))
+        self.generation += 1
+        # 重建期间发生的失效使注册表仍为失效状态, 下次访问时再次重建
+        self._loaded_invalidations = invalidations
+        # 授权变更(含刷新 API 列表后的版本递增)经角色版本号传播到各进程, Api 索引随注册表一并重建
+        api_index.invalidate()
+
+    def _is_stale(self, role_versions: dict[str, int] | None) -> bool:
+        return self._loaded_invalidations != self._invalidations or bool(
+            role_versions
+            and any(self.role_versions.get(role_code, 0) < version for role_code, version in role_versions.items())
+        )
+
+    async def ensure_loaded(self, role_versions: dict[str, int] | None = None) -> None:
+        """
+        确保注册表已加载且不旧于给定的角色权限版本, 并发的调用只重建一次
+
+        Args:
+            role_versions: 角色编码 -> 权限版本号, 任一角色的本地版本更旧时重建
+        """
+        if not self._is_stale(role_versions):
+            return
+        async with self._lock:
+            # 等待锁期间其他协程可能已完成重建
+            if self._is_stale(role_versions):
+                await self._rebuild()
+
+    async def reload(self) -> None:
+        """立即从数据库重建"""
+        self.invalidate()
+        await self.ensure_loaded()
+
+    def invalidate(self) -> None:
+        """标记注册表失效, 下次访问时重建"""
+        self._invalidations += 1
+
+    async def get_grants(self, role_codes: list[str]) -> RoleGrants:
+        """获取多个角色合并后的授权位图, 超级管理员拥有全部授权"""
+        await self.ensure_loaded()
+        if "R_SUPER" in role_codes:
+            return self.all_grants
+
+        grants = RoleGrants()
+        for role_code in role_codes:
+            if (role_grant := self.role_grants.get(role_code)) is not None:
+                grants |= role_grant
+        return grants
+
+    def check_api(self, grants: RoleGrants, api_id: int) -> PermissionDecision:
+        """判定授权位图是否允许访问指定 API"""
+        slot = self.api_slots.get(api_id)
+        if slot is None or not grants.apis >> slot & 1:
+            return PermissionDecision.deny
+        if self.disabled_api_bits >> slot & 1:
+            return PermissionDecision.disabled
+        return PermissionDecision.allow
+
+    def get_button_codes(self, grants: RoleGrants) -> list[str]:
+        """解码授权位图中的按钮编码"""
+        return list(dict.fromkeys(self.button_codes[slot] for slot in iter_bits(grants.buttons)))
+
+    def get_role_button_codes(self, role_codes: list[str]) -> list[str]:
+        """合并多个角色已物化的按钮编码集合"""
+        if "R_SUPER" in role_codes:
+            return list(self.all_button_codes)
+        if len(role_codes) == 1:
+            return list(self.role_button_codes.get(role_codes[0], ()))
+        return list(
+            dict.fromkeys(code for role_code in role_codes for code in self.role_button_codes.get(role_code, ()))
+        )
+
+    def get_menu_ids(self, grants: RoleGrants) -> list[int]:
+        """解码授权位图中的菜单 id"""
+        return [self.menu_ids[slot] for slot in iter_bits(grants.menus)]
+
+    def get_api_ids(self, grants: RoleGrants) -> list[int]:
+        """解码授权位图中的 Api id"""
+        slot_api_ids = list(self.api_slots)
+        return [slot_api_ids[slot] for slot in iter_bits(grants.apis)]
+
+    def get_home(self, role_codes: list[str], default: str = "home") -> str:
+        """获取角色集合的首页路由名称, 多个角色时取角色id最大且配置了首页的角色"""
+        home = default
+        for role_code in self.role_homes:
+            if role_code in role_codes:
+                home = self.role_homes[role_code]
+        return home
+
+
+class PermissionCache:
+    """
+    集群共享的权限判定缓存
+
+    - 用户角色集合: permission:user_roles:{user_id}, 角色变更时删除
+    - 角色权限版本: permission:role_versions 哈希, 与 Role.perm_version 保持一致
+    - 权限判定结果: permission:decision:{角色及版本摘要}:{api_id}, 版本变化即换键, 不依赖 TTL 失效
+    - 令牌权限戳: 全局纪元 permission:epoch + 用户纪元 permission:user_epoch:{user_id},
+      用户或角色编码变化时轮换, 令牌中携带的角色编码随之失效
+    - 身份快照失效通知: 频道 permission:principal_invalidate, 消息为逗号分隔的用户id, "*" 表示全部用户
+    """
+
+    USER_ROLES_KEY = "permission:user_roles:{user_id}"
+    ROLE_VERSIONS_KEY = "permission:role_versions"
+    DECISION_KEY = "permission:decision:{digest}:{api_id}"
+    EPOCH_KEY = "permission:epoch"
+    USER_EPOCH_KEY = "permission:user_epoch:{user_id}"
+    PRINCIPAL_CHANNEL = "permission:principal_invalidate"
+    # 仅用于回收旧版本遗留的键, 判定结果的新鲜度由版本号保证
+    DECISION_KEY_EXPIRE = 24 * 3600
+
+    def __init__(self):
+        self._invalidation_listeners: list[Callable[[list[int] | None], None]] = []
+
+    @property
+    def redis(self):
+        return cache_manager.redis
+
+    def add_invalidation_listener(self, listener: Callable[[list[int] | None], None]) -> None:
+        """注册本进程的身份快照失效回调, 参数为用户id列表, None 表示全部用户"""
+        self._invalidation_listeners.append(listener)
+
+    async def notify_principals(self, user_ids: list[int] | None = None) -> None:
+        """
+        通知各进程清理用户身份快照, 本进程立即生效, 其他进程经 Redis 发布订阅生效
+
+        Args:
+            user_ids: 需要清理的用户id列表, None 表示全部用户
+        """
+        for listener in self._invalidation_listeners:
+            listener(user_ids)
+
+        if not self.redis:
+            return
+        message = "*" if user_ids is None else ",".join(str(user_id) for user_id in user_ids)
+        try:
+            await self.redis.publish(self.PRINCIPAL_CHANNEL, message)
+        except RedisError as e:
+            log.warning(f"Failed to publish principal invalidation: {e!r}")
+
+    async def get_user_role_codes(self, user_id: int) -> list[str]:
+        """获取用户的角色编码列表, 优先读取 Redis"""
+        key = self.USER_ROLES_KEY.format(user_id=user_id)
+        if self.redis:
+            try:
+                if (cached := await self.redis.get(key)) is not None:
+                    return cached.split("|") if cached else []
+            except RedisError as e:
+                log.warning(f"Failed to get user roles from redis: {e!r}")
+
+        role_codes: list[str] = await Role.filter(by_role_users__id=user_id).values_list("role_code", flat=True)
+        if self.redis:
+            try:
+                await self.redis.set(key, "|".join(role_codes))
+            except RedisError as e:
+                log.warning(f"Failed to cache user roles: {e!r}")
+        return role_codes
+
+    async def get_role_versions(self, role_codes: list[str]) -> dict[str, int]:
+        """获取角色的当前权限版本号, Redis 不可用时回退到数据库"""
+        if not role_codes:
+            return {}
+
+        if self.redis:
+            try:
+                versions = await self.redis.hmget(self.ROLE_VERSIONS_KEY, role_codes)
+                if missing := [role_code for role_code, version in zip(role_codes, versions) if version is None]:
+                    # 只补齐缺失的角色, 不覆盖其他进程已发布的版本, 也不触发全局失效
+                    backfill = dict(await Role.filter(role_code__in=missing).values_list("role_code", "perm_version"))
+                    if backfill:
+                        async with self.redis.pipeline(transaction=False) as pipe:
+                            for role_code, version in backfill.items():
+                                pipe.hsetnx(self.ROLE_VERSIONS_KEY, role_code, version)
+                            pipe.hmget(self.ROLE_VERSIONS_KEY, role_codes)
+                            *_, versions = await pipe.execute()
+                return {
+                    role_code: int(version) if version is not None else 0
+                    for role_code, version in zip(role_codes, versions)
+                }
+            except RedisError as e:
+                log.warning(f"Failed to get role versions from redis: {e!r}")
+
+        versions = dict(await Role.filter(role_code__in=role_codes).values_list("role_code", "perm_version"))
+        return {role_code: versions.get(role_code, 0) for role_code in role_codes}
+
+    async def get_permission_stamp(self, user_id: int) -> str | None:
+        """
+        获取用户当前的权限戳, 写入访问令牌后用于判断令牌中的角色编码是否仍然有效
+
+        Returns:
+            str | None: 权限戳, Redis 不可用时返回 None
+        """
+        if not self.redis:
+            return None
+
+        keys = [self.EPOCH_KEY, self.USER_EPOCH_KEY.format(user_id=user_id)]
+        try:
+            epochs = await self.redis.mget(keys)
+            if any(epoch is None for epoch in epochs):
+                # 纪元使用随机值而非计数, Redis 数据丢失后重建也不会与旧令牌碰撞
+                for key, epoch in zip(keys, epochs):
+                    if epoch is None:
+                        await self.redis.set(key, uuid4().hex[:8], nx=True)
+                epochs = await self.redis.mget(keys)
+            return ".".join(epochs)
+        except RedisError as e:
+            log.warning(f"Failed to get permission stamp: {e!r}")
+            return None
+
+    async def invalidate_users(self, user_ids: list[int]) -> None:
+        """清理用户的角色缓存及身份快照, 并轮换其权限戳"""
+        if not user_ids:
+            return
+
+        await self.notify_principals(user_ids)
+        if not self.redis:
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for user_id in user_ids:
+                    pipe.delete(self.USER_ROLES_KEY.format(user_id=user_id))
+                    pipe.set(self.USER_EPOCH_KEY.format(user_id=user_id), uuid4().hex[:8])
+                await pipe.execute()
+        except RedisError as e:
+            log.warning(f"Failed to invalidate user permissions: {e!r}")
+
+    async def get_grants(self, role_codes: list[str]) -> RoleGrants:
+        """获取多个角色合并后的授权位图, 保证不旧于当前权限版本"""
+        await permission_registry.ensure_loaded(await self.get_role_versions(role_codes))
+        return await permission_registry.get_grants(role_codes)
+
+    async def get_decision(self, role_codes: list[str], api_id: int) -> PermissionDecision:
+        """
+        获取角色集合对指定 API 的权限判定
+
+        Args:
+            role_codes: 用户的角色编码列表
+            api_id: Api id
+
+        Returns:
+            PermissionDecision: allow / deny / disabled
+        """
+        role_versions = await self.get_role_versions(role_codes)
+        digest = hashlib.sha1(
+            ",".join(f"{role_code}@{role_versions[role_code]}" for role_code in sorted(role_versions)).encode()
+        ).hexdigest()
+        key = self.DECISION_KEY.format(digest=digest, api_id=api_id)
+
+        if self.redis:
+            try:
+                if (cached := await self.redis.get(key)) is not None:
+                    return PermissionDecision(cached)
+            except RedisError as e:
+                log.warning(f"Failed to get permission decision from redis: {e!r}")
+
+        await permission_registry.ensure_loaded(role_versions)
+        grants = await permission_registry.get_grants(role_codes)
+        decision = permission_registry.check_api(grants, api_id)
+
+        if self.redis:
+            try:
+                await self.redis.set(key, decision.value, ex=self.DECISION_KEY_EXPIRE)
+            except RedisError as e:
+                log.warning(f"Failed to cache permission decision: {e!r}")
+        return decision
+
+    async def publish_versions(self, user_ids: list[int] | None = None) -> dict[str, int]:
+        """
+        将数据库中已提交的角色权限版本同步到 Redis, 并清理指定用户的角色缓存
+        在事务中修改授权时, 需在事务提交后调用
+
+        Args:
+            user_ids: 角色或状态发生变化的用户id列表
+
+        Returns:
+            dict[str, int]: 角色编码 -> 权限版本号
+        """
+        role_versions = dict(await Role.all().values_list("role_code", "perm_version"))
+        if self.redis:
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.delete(self.ROLE_VERSIONS_KEY)
+                    if role_versions:
+                        pipe.hset(self.ROLE_VERSIONS_KEY, mapping=role_versions)
+                    await pipe.execute()
+            except RedisError as e:
+                log.warning(f"Failed to publish role versions: {e!r}")
+        if user_ids:
+            await self.invalidate_users(user_ids)
+        else:
+            # 角色授权变化, 所有用户的身份快照中的位图均可能过期
+            await self.notify_principals()
+        return role_versions
+
+    async def bump_role_versions(self, role_ids: list[int] | None = None, publish: bool = True) -> None:
+        """
+        递增角色权限版本号
+
+        Args:
+            role_ids: 需要递增的角色id列表, None 表示全部角色(如 API/菜单/按钮本身发生变化)
+            publish: 是否立即同步到 Redis, 在事务中调用时应传 False 并在提交后调用 publish_versions
+        """
+        query = Role.all() if role_ids is None else Role.filter(id__in=role_ids)
+        await query.update(perm_version=F("perm_version") + 1)
+        permission_registry.invalidate()
+        if publish:
+            await self.publish_versions()
+
+    async def clear_user_roles(self) -> None:
+        """清理全部用户的角色缓存及身份快照并轮换全局权限戳, 用于角色编码变更或角色删除"""
+        await self.notify_principals()
+        if not self.redis:
+            return
+
+        await cache_manager.clear_cache(self.USER_ROLES_KEY.format(user_id="*"))
+        try:
+            await self.redis.set(self.EPOCH_KEY, uuid4().hex[:8])
+        except RedisError as e:
+            log.warning(f"Failed to rotate permission epoch: {e!r}")
+
+
+# 全局 API 索引实例
+api_index = ApiIndex()
+
+# 全局角色权限注册表实例
+permission_registry = PermissionRegistry()
+
+# 全局权限判定缓存实例
+permission_cache = PermissionCache()
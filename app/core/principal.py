@@ -0,0 +1,201 @@
+"""
+认证主体模块
+请求鉴权后得到的精简用户身份, 供依赖注入及业务处理使用, 避免重复查询用户表
+- 身份快照按用户缓存在进程内, 带 TTL 并按 LRU 淘汰
+- 用户或授权变更时经 Redis 发布订阅通知各进程清理快照
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from redis.exceptions import RedisError
+
+from app.core.permission import RoleGrants, permission_cache, permission_registry
+from app.log import log
+from app.models.system import StatusType, User
+from app.configs import APP_SETTINGS
+
+
+@dataclass(slots=True)
+class Principal:
+    """已认证的用户身份"""
+
+    id: int
+    user_name: str
+    role_codes: list[str]
+    status_type: StatusType = StatusType.enable
+    button_codes: list[str] = field(default_factory=list)
+    home: str = "home"
+    grants: RoleGrants = field(default_factory=RoleGrants)
+    # 构建时权限注册表的版本, 注册表重建后位图槽位可能变化
+    generation: int = 0
+
+    @property
+    def is_super(self) -> bool:
+        return "R_SUPER" in self.role_codes
+
+    @classmethod
+    def from_user(cls, user: User, role_codes: list[str]) -> Principal:
+        return cls(id=user.id, user_name=user.user_name, role_codes=role_codes, status_type=user.status_type)
+
+
+class PrincipalCache:
+    """进程内的用户身份快照缓存"""
+
+    def __init__(self, ttl: int = 60, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[int, tuple[float, Principal]] = OrderedDict()
+        # 每次失效递增, 加载期间发生失效时不写入可能过期的快照
+        self._generation = 0
+        self._listener_task: asyncio.Task | None = None
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        permission_cache.add_invalidation_listener(self.invalidate_local)
+
+    async def build(
+        self, user_id: int, user_name: str, role_codes: list[str], status_type: StatusType = StatusType.enable
+    ) -> Principal:
+        """由角色编码构建身份, 按钮、首页及位图均取自权限注册表"""
+        grants = await permission_cache.get_grants(role_codes)
+        return Principal(
+            id=user_id,
+            user_name=user_name,
+            role_codes=role_codes,
+            status_type=status_type,
+            button_codes=permission_registry.get_role_button_codes(role_codes),
+            home=permission_registry.get_home(role_codes),
+            grants=grants,
+            generation=permission_registry.generation,
+        )
+
+    def get(self, user_id: int) -> Principal | None:
+        """获取未过期的身份快照"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expire_at, principal = entry
+            if expire_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.stats["hits"] += 1
+                return principal
+            del self._entries[user_id]
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, principal: Principal, generation: int | None = None) -> None:
+        """
+        写入身份快照
+
+        Args:
+            principal: 用户身份
+            generation: 开始加载时的失效计数, 期间发生过失效则放弃写入
+        """
+        if self.ttl <= 0 or (generation is not None and generation != self._generation):
+            return
+
+        self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(principal.id)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def load(self, user_id: int, claims: dict[str, Any] | None = None) -> Principal | None:
+        """
+        获取用户身份, 快照缺失时重新构建
+
+        Args:
+            user_id: 用户id
+            claims: 访问令牌中的用户数据, 携带的权限戳仍为最新时直接使用其中的角色编码, 不查询数据库
+
+        Returns:
+            Principal | None: 用户身份, 用户不存在时返回 None
+        """
+        generation = self._generation
+        if (principal := self.get(user_id)) is not None:
+            return await self.refresh(principal, generation)
+
+        if claims and "permVersion" in claims and claims["permVersion"] == await permission_cache.get_permission_stamp(
+            user_id
+        ):
+            principal = await self.build(user_id, claims["userName"], claims["roles"])
+        else:
+            user = await User.filter(id=user_id).first()
+            if not user:
+                return None
+
+            role_codes = await permission_cache.get_user_role_codes(user.id)
+            principal = await self.build(user.id, user.user_name, role_codes, user.status_type)
+        self.put(principal, generation)
+        return principal
+
+    async def refresh(self, principal: Principal, generation: int | None = None) -> Principal:
+        """
+        注册表重建后位图槽位可能变化, 按当前注册表重新解码授权
+
+        解码位图(get_api_ids / get_menu_ids)前需调用, 同一请求中权限判定可能已触发重建
+
+        Args:
+            principal: 用户身份
+            generation: 开始加载时的失效计数, 见 put
+
+        Returns:
+            Principal: 位图与当前注册表一致的身份
+        """
+        if principal.generation == permission_registry.generation:
+            return principal
+        # 沿用快照中的用户信息, 仅重新解码授权
+        principal = await self.build(principal.id, principal.user_name, principal.role_codes, principal.status_type)
+        self.put(principal, self._generation if generation is None else generation)
+        return principal
+
+    def invalidate_local(self, user_ids: list[int] | None = None) -> None:
+        """清理本进程的身份快照, user_ids 为 None 时清理全部"""
+        self._generation += 1
+        self.stats["invalidations"] += 1
+        if user_ids is None:
+            self._entries.clear()
+            return
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+
+    def get_stats(self) -> dict[str, int]:
+        return {**self.stats, "size": len(self._entries), "ttl": self.ttl}
+
+    async def start(self) -> None:
+        """启动失效通知订阅"""
+        if self._listener_task is None and permission_cache.redis:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """停止失效通知订阅"""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with permission_cache.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(permission_cache.PRINCIPAL_CHANNEL)
+                    # 订阅中断期间可能漏掉通知, 重新订阅后清理全部快照
+                    self.invalidate_local()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = message["data"]
+                        self.invalidate_local(None if data == "*" else [int(i) for i in data.split(",") if i])
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                log.warning(f"Principal invalidation subscription lost, retrying: {e!r}")
+                await asyncio.sleep(5)
+
+
+# 全局身份快照缓存实例
+principal_cache = PrincipalCache(ttl=APP_SETTINGS.get("PRINCIPAL_CACHE_TTL", 60))
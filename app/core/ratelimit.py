@@ -0,0 +1,134 @@
+"""
+限流模块
+基于 Redis 有序集合的滑动窗口限流, 多进程共享计数; Redis 不可用时回退到进程内计数
+"""
+
+import time
+from collections import deque
+from uuid import uuid4
+
+from fastapi import Request
+from redis.exceptions import RedisError
+
+from app.core.cache import cache_manager
+from app.core.exceptions import HTTPException
+from app.log import log
+from app.configs import APP_SETTINGS
+
+# 清理窗口外的记录后, 未达上限则记录本次请求; 超限时返回最早一条记录离开窗口所需的毫秒数
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return 0
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return math.max(math.ceil(tonumber(oldest[2]) + window - now), 1)
+"""
+
+
+class SlidingWindowLimiter:
+    """滑动窗口限流器, 窗口内同一键最多放行 limit 次"""
+
+    KEY = "ratelimit:{name}:{key}"
+    # 进程内回退计数最多保留的键数量
+    MAX_LOCAL_KEYS = 10000
+
+    def __init__(self, name: str, limit: int, window: int):
+        """
+        Args:
+            name: 限流器名称, 作为 Redis 键前缀的一部分
+            limit: 窗口内允许的请求次数, 0 表示不限流
+            window: 窗口长度(秒)
+        """
+        self.name = name
+        self.limit = limit
+        self.window_ms = window * 1000
+        self._script = None
+        self._script_redis = None
+        self._local: dict[str, deque[float]] = {}
+        self._redis_failed = False
+
+    async def hit(self, key: str) -> int:
+        """
+        记录一次请求
+
+        Args:
+            key: 限流键, 如用户名或客户端IP
+
+        Returns:
+            int: 0 表示放行, 否则为需要等待的毫秒数
+        """
+        if self.limit <= 0:
+            return 0
+
+        redis = cache_manager.redis
+        if redis is not None:
+            try:
+                if self._script is None or self._script_redis is not redis:
+                    self._script = redis.register_script(_SLIDING_WINDOW_SCRIPT)
+                    self._script_redis = redis
+                now = int(time.time() * 1000)
+                retry_after = await self._script(
+                    keys=[self.KEY.format(name=self.name, key=key)],
+                    args=[now, self.window_ms, self.limit, f"{now}:{uuid4().hex[:8]}"],
+                )
+                if self._redis_failed:
+                    self._redis_failed = False
+                    log.info(f"Rate limiter {self.name} switched back to redis")
+                return int(retry_after)
+            except RedisError as e:
+                if not self._redis_failed:
+                    self._redis_failed = True
+                    log.warning(f"Rate limiter {self.name} falls back to local counting: {e!r}")
+
+        return self._hit_local(key)
+
+    def _hit_local(self, key: str) -> int:
+        now = time.monotonic() * 1000
+        hits = self._local.get(key)
+        if hits is None:
+            if len(self._local) >= self.MAX_LOCAL_KEYS:
+                self._purge_local(now)
+            hits = self._local[key] = deque()
+
+        while hits and hits[0] <= now - self.window_ms:
+            hits.popleft()
+        if len(hits) < self.limit:
+            hits.append(now)
+            return 0
+        return max(int(hits[0] + self.window_ms - now), 1)
+
+    def _purge_local(self, now: float) -> None:
+        expired = [key for key, hits in self._local.items() if not hits or hits[-1] <= now - self.window_ms]
+        for key in expired:
+            del self._local[key]
+        # 仍然过多时丢弃最早写入的键, 保证内存有界
+        while len(self._local) >= self.MAX_LOCAL_KEYS:
+            del self._local[next(iter(self._local))]
+
+    async def check(self, key: str) -> None:
+        """记录一次请求, 超限时抛出 429"""
+        if retry_after := await self.hit(key):
+            raise HTTPException(
+                code="429", msg=f"Too many requests, please try again in {-(-retry_after // 1000)} seconds"
+            )
+
+
+def get_client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+login_user_limiter = SlidingWindowLimiter(
+    "login_user", APP_SETTINGS.get("RATE_LIMIT_LOGIN_USER", 10), APP_SETTINGS.get("RATE_LIMIT_LOGIN_WINDOW", 60)
+)
+login_ip_limiter = SlidingWindowLimiter(
+    "login_ip", APP_SETTINGS.get("RATE_LIMIT_LOGIN_IP", 30), APP_SETTINGS.get("RATE_LIMIT_LOGIN_WINDOW", 60)
+)
+error_ip_limiter = SlidingWindowLimiter(
+    "error_ip", APP_SETTINGS.get("RATE_LIMIT_ERROR_IP", 1), APP_SETTINGS.get("RATE_LIMIT_ERROR_WINDOW", 1)
+)
@@ -0,0 +1,88 @@
+"""
+日志脱敏模块
+请求体及响应体共用的脱敏器, 先以预编译的正则在原始字节中查找敏感键, 不包含时直接返回解析结果, 不重建对象
+"""
+
+import re
+from collections.abc import Iterable
+from typing import Any
+
+import orjson
+
+from app.configs import APP_SETTINGS
+
+REDACTED = "***"
+DEFAULT_REDACT_KEYS = (
+    "password",
+    "token",
+    "accessToken",
+    "access_token",
+    "refreshToken",
+    "refresh_token",
+    "authorization",
+    "cookie",
+)
+
+
+class Redactor:
+    """
+    JSON 载荷脱敏器
+
+    - 敏感键不区分大小写, 任意层级的同名键的值均替换为 ***
+    - 载荷超过 max_bytes 时只记录长度
+    - 需要脱敏时只遍历 max_depth 层, 更深的嵌套整体替换为 ***
+    """
+
+    def __init__(self, keys: Iterable[str], max_depth: int = 10, max_bytes: int = 32 * 1024):
+        """
+        Args:
+            keys: 需要脱敏的键
+            max_depth: 最大遍历深度
+            max_bytes: 可记录的最大字节数
+        """
+        self.keys = frozenset(key.lower() for key in keys)
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        alternation = b"|".join(re.escape(key.encode()) for key in sorted(self.keys))
+        # 匹配作为对象键出现的敏感字段; 键中含 \u 转义时无法按字节判断, 同样视为可能包含
+        self._pattern = re.compile(rb'"(?:' + alternation + rb')"\s*:|\\u', re.IGNORECASE) if self.keys else None
+
+    def may_contain(self, raw: bytes | bytearray) -> bool:
+        """原始字节中是否可能包含敏感键"""
+        return self._pattern is not None and self._pattern.search(raw) is not None
+
+    def redact(self, obj: Any, depth: int = 0) -> Any:
+        """递归脱敏已解析的对象"""
+        if isinstance(obj, dict):
+            if depth >= self.max_depth:
+                return REDACTED
+            return {k: (REDACTED if k.lower() in self.keys else self.redact(v, depth + 1)) for k, v in obj.items()}
+        if isinstance(obj, list):
+            if depth >= self.max_depth:
+                return REDACTED
+            return [self.redact(v, depth + 1) for v in obj]
+        return obj
+
+    def loads(self, raw: bytes | bytearray) -> Any:
+        """
+        解析 JSON 并脱敏
+
+        Returns:
+            Any: 脱敏后的数据, 超过 max_bytes 时为 {"_truncated": True, "len": 字节数}
+
+        Raises:
+            orjson.JSONDecodeError: 不是合法的 JSON
+        """
+        if len(raw) > self.max_bytes:
+            return {"_truncated": True, "len": len(raw)}
+        data = orjson.loads(raw)
+        if self.may_contain(raw):
+            return self.redact(data)
+        return data
+
+
+log_redactor = Redactor(
+    keys=APP_SETTINGS.get("LOG_REDACT_KEYS", DEFAULT_REDACT_KEYS),
+    max_depth=APP_SETTINGS.get("LOG_REDACT_MAX_DEPTH", 10),
+    max_bytes=APP_SETTINGS.get("LOG_BODY_MAX_BYTES", 32 * 1024),
+)
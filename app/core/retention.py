@@ -0,0 +1,139 @@
+"""
+日志保留模块
+按 LogType 配置保留天数, 定期按 create_time 分批删除过期的 logs / api_logs 记录
+"""
+
+import asyncio
+from datetime import timedelta
+from typing import Any
+
+from redis.exceptions import RedisError
+from tortoise import timezone
+
+from app.core.archive import log_archive
+from app.core.cache import cache_manager
+from app.log import log
+from app.models.system import APILog, APIRollup, Log, LogType
+from app.configs import APP_SETTINGS
+
+
+class LogRetention:
+    """
+    日志保留任务
+
+    - logs 按 (log_type, create_time) 索引范围删除, api_logs 按 create_time 索引范围删除
+    - 每批删除 batch_size 行, 避免长事务及大范围锁
+    - 启用归档时先将热数据窗口外的API日志导出为归档分段, ApiLog 的保留天数同时作用于归档分段
+    - API指标汇总按 rollup_days 单独保留
+    - 多进程部署时通过 Redis 锁保证同一时间只有一个进程执行
+    """
+
+    LOCK_KEY = "retention:lock"
+
+    def __init__(
+        self,
+        retention_days: dict[str, int],
+        interval_hours: float = 6,
+        batch_size: int = 5000,
+        rollup_days: int = 0,
+    ):
+        """
+        Args:
+            retention_days: LogType 名称 -> 保留天数, 0 或未配置表示永久保留
+            interval_hours: 执行间隔(小时)
+            batch_size: 每批删除的行数
+            rollup_days: API指标汇总的保留天数, 0 表示永久保留
+        """
+        self.retention_days = {log_type: int(retention_days.get(log_type.name, 0)) for log_type in LogType}
+        self.interval = interval_hours * 3600
+        self.batch_size = batch_size
+        self.rollup_days = rollup_days
+        self._task: asyncio.Task | None = None
+        self.last_result: dict[str, Any] = {}
+
+    async def _delete_batches(self, model: type[Log] | type[APILog] | type[APIRollup], **filters: Any) -> int:
+        """按主键分批删除满足条件的记录, 返回删除的行数"""
+        deleted = 0
+        while True:
+            ids = await model.filter(**filters).order_by("id").limit(self.batch_size).values_list("id", flat=True)
+            if not ids:
+                return deleted
+            deleted += await model.filter(id__in=ids).delete()
+            if len(ids) < self.batch_size:
+                return deleted
+            # 让出事件循环, 避免连续删除占满数据库连接
+            await asyncio.sleep(0)
+
+    async def run_once(self) -> dict[str, int]:
+        """执行一次保留清理, 返回各类日志删除的行数"""
+        now = timezone.now()
+        result: dict[str, int] = {}
+
+        if log_archive.enabled:
+            result["APILogArchived"] = await log_archive.archive_before(now - timedelta(days=log_archive.after_days))
+
+        for log_type, days in self.retention_days.items():
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            result[log_type.name] = await self._delete_batches(Log, log_type=log_type, create_time__lt=cutoff)
+
+        if (api_days := self.retention_days[LogType.ApiLog]) > 0:
+            # logs 中指向已删除 api_logs 的记录由外键置空, 此前 ApiLog 类型的 logs 已按相同期限删除
+            cutoff = now - timedelta(days=api_days)
+            result["APILogRecord"] = await self._delete_batches(APILog, create_time__lt=cutoff)
+            if log_archive.enabled:
+                result["APILogSegment"] = await asyncio.to_thread(log_archive.expire_before, cutoff)
+
+        if self.rollup_days > 0:
+            cutoff = now - timedelta(days=self.rollup_days)
+            result["APIRollup"] = await self._delete_batches(APIRollup, bucket__lt=cutoff)
+
+        self.last_result = {"finished_at": now.isoformat(), "deleted": result}
+        return result
+
+    async def _acquire_lock(self) -> bool:
+        redis = cache_manager.redis
+        if redis is None:
+            return True
+        try:
+            # 锁的有效期略短于执行间隔, 进程异常退出后下一轮可由其他进程接手
+            return bool(await redis.set(self.LOCK_KEY, "1", nx=True, ex=max(int(self.interval * 0.9), 60)))
+        except RedisError as e:
+            log.warning(f"Failed to acquire retention lock: {e!r}")
+            return True
+
+    async def start(self) -> None:
+        if self._task is None and (
+            log_archive.enabled or self.rollup_days > 0 or any(days > 0 for days in self.retention_days.values())
+        ):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self._acquire_lock():
+                    result = await self.run_once()
+                    log.info(f"Log retention finished, deleted: {result}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"Log retention failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+
+log_retention = LogRetention(
+    retention_days=dict(APP_SETTINGS.get("LOG_RETENTION_DAYS", {})),
+    interval_hours=APP_SETTINGS.get("LOG_RETENTION_INTERVAL_HOURS", 6),
+    batch_size=APP_SETTINGS.get("LOG_RETENTION_BATCH_SIZE", 5000),
+    rollup_days=APP_SETTINGS.get("API_ROLLUP_RETENTION_DAYS", 0),
+)
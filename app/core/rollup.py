@@ -0,0 +1,398 @@
+"""
+API指标汇总模块
+请求完成时按 (分钟, 路由模板, 请求方法, 业务状态码) 在进程内累加请求数、错误数及处理时间分布,
+由后台任务定期合并写入 api_rollups, 统计接口只读取汇总表, 不扫描 api_logs
+- 处理时间分布使用对数分桶的草图, 不同进程、不同分钟的草图按桶相加即可合并, 分位数的相对误差不超过 1%
+- 汇总在采样之前进行, 被采样丢弃的请求同样计入
+"""
+
+import asyncio
+import math
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from tortoise import timezone
+from tortoise.exceptions import DBConnectionError, IntegrityError, OperationalError, TransactionManagementError
+from tortoise.transactions import in_transaction
+
+from app.log import log
+from app.models.system import APIRollup
+from app.configs import APP_SETTINGS
+
+
+class LatencySketch:
+    """
+    可合并的分位数草图
+
+    值 x 落入编号为 ceil(log_gamma(x)) 的桶, gamma = (1 + a) / (1 - a), 以桶的代表值估算分位数时相对误差不超过 a;
+    不超过 MIN_VALUE 的值单独计数, 按 0 处理
+    """
+
+    RELATIVE_ACCURACY = 0.01
+    MIN_VALUE = 1e-6
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    _LOG_GAMMA = math.log(GAMMA)
+
+    __slots__ = ("bins", "zero_count", "count")
+
+    def __init__(self, bins: dict[int, int] | None = None, zero_count: int = 0):
+        self.bins: dict[int, int] = bins if bins is not None else {}
+        self.zero_count = zero_count
+        self.count = zero_count + sum(self.bins.values())
+
+    def add(self, value: float) -> None:
+        if value <= self.MIN_VALUE:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._LOG_GAMMA)
+            self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+
+    def merge(self, other: LatencySketch) -> None:
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> float | None:
+        """估算分位数, q 取值 0~1, 没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * self.GAMMA**key / (self.GAMMA + 1)
+        return 2 * self.GAMMA ** max(self.bins) / (self.GAMMA + 1)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"zero": self.zero_count, "bins": [[key, count] for key, count in sorted(self.bins.items())]}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any] | None) -> LatencySketch:
+        if not data:
+            return cls()
+        return cls({key: count for key, count in data["bins"]}, data["zero"])
+
+
+@dataclass(slots=True)
+class RollupEntry:
+    """一个汇总键下的累计值"""
+
+    request_count: int = 0
+    error_count: int = 0
+    total_time: float = 0
+    max_time: float = 0
+    sketch: LatencySketch = field(default_factory=LatencySketch)
+
+    def add(self, process_time: float | None, is_error: bool) -> None:
+        self.request_count += 1
+        self.error_count += is_error
+        if process_time is not None:
+            self.total_time += process_time
+            self.max_time = max(self.max_time, process_time)
+            self.sketch.add(process_time)
+
+    def merge(self, other: RollupEntry) -> None:
+        self.request_count += other.request_count
+        self.error_count += other.error_count
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.sketch.merge(other.sketch)
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any]) -> RollupEntry:
+        """由 api_rollups 的 values() 行构建"""
+        return cls(
+            request_count=row["request_count"],
+            error_count=row["error_count"],
+            total_time=row["total_time"],
+            max_time=row["max_time"],
+            sketch=LatencySketch.from_dict(row["sketch"]),
+        )
+
+    def to_record(self) -> dict[str, Any]:
+        """转换为统计接口的结构, 时间单位为秒"""
+        timed = self.sketch.count
+        return {
+            "requestCount": self.request_count,
+            "errorCount": self.error_count,
+            "errorRate": self.error_count / self.request_count if self.request_count else 0,
+            "avgTime": self.total_time / timed if timed else None,
+            "maxTime": self.max_time if timed else None,
+            "p50": self.sketch.quantile(0.5),
+            "p95": self.sketch.quantile(0.95),
+            "p99": self.sketch.quantile(0.99),
+        }
+
+
+# (分钟时间桶, 路由模板, 请求方法, 业务状态码)
+RollupKey = tuple[datetime, str, str, str]
+
+
+class APIRollupWriter:
+    """
+    API指标汇总写入器
+
+    - 请求链路只在进程内字典中累加, 不访问数据库
+    - 后台任务每隔 flush_interval 秒在一个事务中合并写入: 已存在的汇总行加锁后累加, 不存在的批量插入
+    - 多进程同时写入同一汇总键时的唯一键冲突、死锁及锁等待超时立即重试一次, 此时汇总行已存在, 改为累加
+    - 仍然失败时累计值放回内存, 下次写入时重试, 内存中的汇总键超过 MAX_PENDING 时丢弃最早的时间桶;
+      数据库可用且不是锁冲突的失败由数据引起, 重试无效, 连续失败 MAX_RETRIES 次的锁冲突同样视为无法写入, 记录后丢弃
+    """
+
+    # HTTP 状态码达到该值或业务状态码不是成功码时计为错误, -1 表示未能解析出业务状态码, 不计为错误
+    ERROR_STATUS_CODE = 400
+    NON_ERROR_CODES = frozenset({"0000", "-1"})
+    # 业务状态码为 -1 或 3~4 位数字, 其他值(调用方透传的任意字符串)归为 OTHER_CODE, 避免汇总键无限增长
+    CODE_PATTERN = re.compile(r"-1|\d{3,4}")
+    OTHER_CODE = "other"
+    # 写入失败时内存中保留的汇总键上限
+    MAX_PENDING = 10000
+    # 唯一键冲突、死锁(MySQL 1213)、锁等待超时等并发写入冲突, 重试可以成功
+    RETRYABLE_ERRORS = (IntegrityError, OperationalError, TransactionManagementError, DBConnectionError)
+    # 数据库可用时可重试错误的最大连续失败次数
+    MAX_RETRIES = 5
+
+    def __init__(self, flush_interval: float = 10, enabled: bool = True):
+        """
+        Args:
+            flush_interval: 写入间隔(秒)
+            enabled: 是否启用汇总
+        """
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._pending: dict[RollupKey, RollupEntry] = {}
+        self._task: asyncio.Task | None = None
+        self._failures = 0
+        self.stats = {"recorded": 0, "flushes": 0, "rows_written": 0, "failed": 0, "discarded": 0}
+
+    def record(
+        self,
+        method: str,
+        route_path: str | None,
+        response_code: str,
+        status_code: int,
+        process_time: float | None,
+    ) -> None:
+        """
+        累加一个已完成的请求
+
+        Args:
+            method: 请求方法
+            route_path: 路由模板, 未匹配路由时为 None
+            response_code: 业务状态码
+            status_code: HTTP 状态码
+            process_time: 请求处理耗时(秒)
+        """
+        if not self.enabled:
+            return
+        is_error = status_code >= self.ERROR_STATUS_CODE or response_code not in self.NON_ERROR_CODES
+        if not self.CODE_PATTERN.fullmatch(response_code):
+            response_code = self.OTHER_CODE
+        bucket = timezone.now().replace(second=0, microsecond=0)
+        key = (bucket, route_path or "", method, response_code)
+        if (entry := self._pending.get(key)) is None:
+            entry = self._pending[key] = RollupEntry()
+        entry.add(process_time, is_error)
+        self.stats["recorded"] += 1
+
+    async def _write(self, pending: dict[RollupKey, RollupEntry]) -> None:
+        async with in_transaction():
+            rows = await (
+                APIRollup.filter(
+                    bucket__in={key[0] for key in pending}, route_path__in={key[1] for key in pending}
+                ).select_for_update()
+            )
+            existing = {(row.bucket, row.route_path, row.request_method, row.response_code): row for row in rows}
+            updated, created = [], []
+            for key, entry in pending.items():
+                if (row := existing.get(key)) is not None:
+                    sketch = LatencySketch.from_dict(row.sketch)
+                    sketch.merge(entry.sketch)
+                    row.request_count += entry.request_count
+                    row.error_count += entry.error_count
+                    row.total_time += entry.total_time
+                    row.max_time = max(row.max_time, entry.max_time)
+                    row.sketch = sketch.to_dict()
+                    updated.append(row)
+                else:
+                    bucket, route_path, method, response_code = key
+                    created.append(
+                        APIRollup(
+                            bucket=bucket,
+                            route_path=route_path,
+                            request_method=method,
+                            response_code=response_code,
+                            request_count=entry.request_count,
+                            error_count=entry.error_count,
+                            total_time=entry.total_time,
+                            max_time=entry.max_time,
+                            sketch=entry.sketch.to_dict(),
+                        )
+                    )
+            if updated:
+                await APIRollup.bulk_update(
+                    updated, fields=["request_count", "error_count", "total_time", "max_time", "sketch"]
+                )
+            if created:
+                await APIRollup.bulk_create(created)
+
+    @staticmethod
+    async def _db_available() -> bool:
+        """数据库是否可用, 用于区分连接类的暂时性错误与数据错误"""
+        try:
+            await APIRollup._meta.db.execute_query("SELECT 1")
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, entries: Iterable[RollupEntry]) -> None:
+        self.stats["discarded"] += sum(entry.request_count for entry in entries)
+
+    async def flush(self) -> int:
+        """写入内存中的累计值, 返回写入的汇总行数"""
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        try:
+            try:
+                await self._write(pending)
+            except self.RETRYABLE_ERRORS:
+                await self._write(pending)
+        except Exception as e:
+            log.warning(f"Failed to flush API rollups: {e!r}")
+            self.stats["failed"] += 1
+            self._failures += 1
+            if await self._db_available() and (
+                not isinstance(e, self.RETRYABLE_ERRORS) or self._failures > self.MAX_RETRIES
+            ):
+                self._failures = 0
+                self._discard(pending.values())
+                return 0
+            # 写入期间新累加的值与未写入的值合并
+            for key, entry in pending.items():
+                if (current := self._pending.get(key)) is not None:
+                    entry.merge(current)
+                self._pending[key] = entry
+            if len(self._pending) > self.MAX_PENDING:
+                dropped = sorted(self._pending, key=lambda key: key[0])[: len(self._pending) - self.MAX_PENDING]
+                self._discard(self._pending.pop(key) for key in dropped)
+            return 0
+
+        self._failures = 0
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(pending)
+        return len(pending)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {**self.stats, "enabled": self.enabled, "pending": len(self._pending)}
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台写入并写入剩余的累计值"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def _summarize(
+    rows: Iterable[dict[str, Any]], group_by: str, interval: int
+) -> dict[tuple[Any, ...], tuple[RollupEntry, dict[str, int]]]:
+    groups: dict[tuple[Any, ...], tuple[RollupEntry, dict[str, int]]] = {}
+    for row in rows:
+        if group_by == "time":
+            bucket: datetime = row["bucket"]
+            key = (bucket - timedelta(minutes=(bucket.hour * 60 + bucket.minute) % interval),)
+        else:
+            key = (row["route_path"], row["request_method"])
+        if (group := groups.get(key)) is None:
+            group = groups[key] = (RollupEntry(), {})
+        entry, codes = group
+        entry.merge(RollupEntry.from_row(row))
+        codes[row["response_code"]] = codes.get(row["response_code"], 0) + row["request_count"]
+    return groups
+
+
+async def summarize_rollups(
+    start: datetime,
+    end: datetime,
+    route_path: str | None = None,
+    request_method: str | None = None,
+    group_by: str = "route",
+    interval: int = 1,
+) -> list[dict[str, Any]]:
+    """
+    按路由或时间汇总 [start, end) 内的API指标
+
+    Args:
+        start: 起始时间
+        end: 截止时间
+        route_path: 路由模板
+        request_method: 请求方法
+        group_by: route 按 (路由模板, 请求方法) 汇总, 按请求数降序; time 按 interval 分钟汇总, 按时间升序
+        interval: 按时间汇总的间隔(分钟)
+
+    Returns:
+        list[dict]: 各分组的请求数、错误数、错误率、平均/最大处理时间、p50/p95/p99 及各业务状态码的请求数
+    """
+    query = APIRollup.filter(bucket__gte=start, bucket__lt=end)
+    if route_path is not None:
+        query = query.filter(route_path=route_path)
+    if request_method:
+        query = query.filter(request_method=request_method)
+    rows = await query.values(
+        "bucket",
+        "route_path",
+        "request_method",
+        "response_code",
+        "request_count",
+        "error_count",
+        "total_time",
+        "max_time",
+        "sketch",
+    )
+
+    groups = await asyncio.to_thread(_summarize, rows, group_by, interval)
+    records = []
+    for key, (entry, codes) in groups.items():
+        if group_by == "time":
+            record = {
+                "fmtBucket": key[0].strftime(APP_SETTINGS.DATETIME_FORMAT),
+                "bucket": int(key[0].timestamp() * 1000),
+            }
+        else:
+            record = {"routePath": key[0], "requestMethod": key[1]}
+        records.append({**record, **entry.to_record(), "responseCodes": codes})
+
+    if group_by == "time":
+        records.sort(key=lambda record: record["bucket"])
+    else:
+        records.sort(key=lambda record: record["requestCount"], reverse=True)
+    return records
+
+
+api_rollup_writer = APIRollupWriter(
+    flush_interval=APP_SETTINGS.get("API_ROLLUP_FLUSH_INTERVAL", 10),
+    enabled=APP_SETTINGS.get("API_ROLLUP_ENABLED", True),
+)
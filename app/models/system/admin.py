@@ -48,6 +48,7 @@ class Role(BaseModel, TimestampMixin):
         "models.Menu", related_name=None, description="角色首页", on_delete=fields.NO_ACTION
     )
     status_type = fields.CharEnumField(enum_type=StatusType, default=StatusType.enable, description="状态")
+    perm_version = fields.IntField(default=0, description="权限版本, 授权变更时递增")
 
     # 关联关系
     by_role_menus: fields.ManyToManyRelation[Menu] = fields.ManyToManyField("models.Menu", related_name="by_menu_roles")
@@ -164,6 +165,8 @@ class Log(BaseModel):
             ("by_user",),
             ("log_detail_type",),
             ("x_request_id",),
+            # 按类型的时间范围查询及保留清理
+            ("log_type", "create_time"),
         ]
 
 
@@ -174,6 +177,8 @@ class APILog(BaseModel):
     user_agent = fields.CharField(null=True, max_length=500, description="User-Agent")
     request_domain = fields.CharField(max_length=200, description="请求域名")
     request_path = fields.CharField(max_length=500, description="请求路径")
+    request_method = fields.CharField(null=True, max_length=10, description="请求方法")
+    route_path = fields.CharField(null=True, max_length=500, description="匹配的路由模板")
     request_params = fields.JSONField(null=True, description="请求参数")
     request_data = fields.JSONField(null=True, description="请求体数据")
     response_data = fields.JSONField(null=True, description="响应数据")
@@ -189,8 +194,30 @@ class APILog(BaseModel):
             ("process_time",),
             ("x_request_id",),
             ("request_path",),
+            ("route_path", "request_method"),
             ("response_code",),
         ]
 
 
-__all__ = ["User", "Role", "Api", "Menu", "Button", "Log", "APILog"]
+class APIRollup(BaseModel):
+    id = fields.IntField(pk=True, description="汇总id")
+    bucket = fields.DatetimeField(description="分钟时间桶")
+    route_path = fields.CharField(max_length=500, default="", description="路由模板, 未匹配路由时为空")
+    request_method = fields.CharField(max_length=10, description="请求方法")
+    response_code = fields.CharField(max_length=6, description="业务状态码")
+    request_count = fields.IntField(default=0, description="请求数")
+    error_count = fields.IntField(default=0, description="错误数")
+    total_time = fields.FloatField(default=0, description="处理时间合计")
+    max_time = fields.FloatField(default=0, description="最大处理时间")
+    sketch = fields.JSONField(description="处理时间分布草图")
+
+    class Meta:
+        table = "api_rollups"
+        table_description = "API指标汇总"
+        unique_together = (("bucket", "route_path", "request_method", "response_code"),)
+        indexes = [
+            ("route_path", "request_method", "bucket"),
+        ]
+
+
+__all__ = ["User", "Role", "Api", "Menu", "Button", "Log", "APILog", "APIRollup"]
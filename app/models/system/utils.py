@@ -1,6 +1,7 @@
 from datetime import datetime
 from decimal import Decimal
 from enum import Enum
+from typing import Any
 from uuid import UUID
 
 from tortoise import models, fields
@@ -56,6 +57,32 @@ class BaseModel(models.Model):
         abstract = True
 
 
+def values_to_dict(row: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    """
+    将 values() 查询得到的一行转换为与 BaseModel.to_dict 相同的结构
+
+    Args:
+        row: values() 返回的一行
+        prefix: 只转换以该前缀开头的键并去掉前缀, 如关联查询的 "api_log__"
+    """
+    d = {}
+    for key, value in row.items():
+        if not key.startswith(prefix):
+            continue
+        field = key.removeprefix(prefix)
+        if isinstance(value, datetime):
+            d[to_lower_camel_case("fmt_" + field)] = value.strftime(APP_SETTINGS.DATETIME_FORMAT)
+            value = int(value.timestamp() * 1000)
+        elif isinstance(value, UUID):
+            value = str(value)
+        elif isinstance(value, Decimal):
+            value = float(value)
+        elif isinstance(value, Enum):
+            value = value.value
+        d[to_lower_camel_case(field)] = value
+    return d
+
+
 class TimestampMixin:
     create_time = fields.DatetimeField(auto_now_add=True)
     update_time = fields.DatetimeField(auto_now=True)
@@ -187,6 +214,7 @@ class IconType(str, Enum):
 
 __all__ = [
     "BaseModel",
+    "values_to_dict",
     "TimestampMixin",
     "EnumBase",
     "IntEnum",
@@ -19,6 +19,7 @@ class BaseApi(BaseModel):
 class ApiSearch(BaseApi):
     current: Annotated[int | None, Field(title="页码")] = 1
     size: Annotated[int | None, Field(title="每页数量")] = 10
+    cursor: Annotated[str | None, Field(title="游标", description="空字符串表示第一页, 传入时使用游标分页并忽略页码")] = None
 
 
 class ApiCreate(BaseApi):
@@ -46,6 +46,8 @@ class SuccessExtra(Custom):
     ):
         if isinstance(data, dict):
             data.update({"total": total, "current": current, "size": size})
+            # 总数按上限截断或估算时标记为非精确, 前端可显示为 "10000+"
+            data["totalExact"] = getattr(total, "exact", True)
         super().__init__(code=code, msg=msg, data=data, status_code=200, **kwargs)
 
 
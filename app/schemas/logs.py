@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Annotated
+from typing import Annotated, Literal
 
 from pydantic import BaseModel, Field
 
@@ -35,19 +35,37 @@ class BaseAPILog(BaseModel):
 class LogSearch(BaseLog):
     current: Annotated[int | None, Field(description="页码")] = None
     size: Annotated[int | None, Field(description="每页数量")] = None
+    cursor: Annotated[str | None, Field(description="游标, 空字符串表示第一页, 传入时使用游标分页并忽略页码")] = None
     log_type: Annotated[LogType | None, Field(alias="logType", description="日志类型")] = None
     log_detail_type: Annotated[str | None, Field(alias="logDetailType", description="日志详细")] = None
     by_user: Annotated[str | None, Field(alias="byUser", description="关联用户")] = None
-    request_path: Annotated[str | None, Field(alias="requestPath", description="请求路径")] = None
+    request_path: Annotated[str | None, Field(alias="requestPath", description="请求路径前缀")] = None
+    route_path: Annotated[str | None, Field(alias="routePath", description="路由模板")] = None
+    request_method: Annotated[str | None, Field(alias="requestMethod", description="请求方法")] = None
     time_range: Annotated[list[datetime, datetime] | None, Field(alias="timeRange", description="时间范围")] = None
     response_code: Annotated[str | None, Field(alias="responseCode", description="业务状态码")] = None
     x_request_id: Annotated[str | None, Field(alias="xRequestId", description="x-request-id")] = None
 
 
+class LogStatsSearch(BaseModel):
+    time_range: Annotated[
+        list[datetime, datetime] | None, Field(alias="timeRange", description="时间范围, 默认最近一小时")
+    ] = None
+    route_path: Annotated[str | None, Field(alias="routePath", description="路由模板")] = None
+    request_method: Annotated[str | None, Field(alias="requestMethod", description="请求方法")] = None
+    group_by: Annotated[
+        Literal["route", "time"], Field(alias="groupBy", description="route 按路由汇总, time 按时间间隔汇总")
+    ] = "route"
+    interval: Annotated[int, Field(ge=1, le=1440, description="按时间汇总的间隔(分钟)")] = 1
+
+    class Config:
+        populate_by_name = True
+
+
 class LogCreate(BaseLog): ...
 
 
 class LogUpdate(BaseLog): ...
 
 
-__all__ = ["BaseLog", "BaseAPILog", "LogSearch", "LogCreate", "LogUpdate"]
+__all__ = ["BaseLog", "BaseAPILog", "LogSearch", "LogStatsSearch", "LogCreate", "LogUpdate"]
@@ -25,6 +25,7 @@ class UserBase(BaseModel):
 class UserSearch(UserBase):
     current: Annotated[int | None, Field(description="页码")] = 1
     size: Annotated[int | None, Field(description="每页数量")] = 10
+    cursor: Annotated[str | None, Field(description="游标, 空字符串表示第一页, 传入时使用游标分页并忽略页码")] = None
 
 
 class UserCreate(UserBase):
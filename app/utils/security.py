@@ -1,18 +1,96 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
 
 import jwt
 from passlib import pwd
 from passlib.context import CryptContext
 
+from app.core.exceptions import HTTPException
 from app.schemas.login import JWTPayload
 from app.configs import APP_SETTINGS
 
 # pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
-# 创建线程池执行器
-_executor = ThreadPoolExecutor(max_workers=None)
+
+class PasswordHasher:
+    """
+    密码哈希执行器
+    argon2 运算放在独立的有界线程池/进程池中执行, 不与事件循环默认执行器的其他任务争抢;
+    排队数超过上限时立即拒绝, 避免登录洪峰拖垮整个服务
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int | None = None, max_queue: int = 64):
+        self.kind = kind
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._pending = 0
+        self.stats = {"completed": 0, "rejected": 0, "failed": 0, "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+
+    @property
+    def executor(self) -> Executor:
+        # 首次使用时创建, 多进程部署时进程池在各 worker 进程内创建
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """在哈希执行器中运行 func, 队列已满时抛出 503 提示稍后重试"""
+        if self._pending >= self.max_workers + self.max_queue:
+            self.stats["rejected"] += 1
+            raise HTTPException(code="503", msg="Server is busy, please try again later")
+
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        except (Exception, asyncio.CancelledError):
+            # 出错或请求取消时不计入完成数及延迟
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.stats["completed"] += 1
+        self.stats["total_latency_ms"] += latency_ms
+        self.stats["max_latency_ms"] = max(self.stats["max_latency_ms"], latency_ms)
+        return result
+
+    def get_stats(self) -> dict[str, Any]:
+        completed = self.stats["completed"]
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self._pending, self.max_workers),
+            "queue_depth": max(self._pending - self.max_workers, 0),
+            "completed": completed,
+            "rejected": self.stats["rejected"],
+            "failed": self.stats["failed"],
+            "avg_latency_ms": round(self.stats["total_latency_ms"] / completed, 2) if completed else 0.0,
+            "max_latency_ms": round(self.stats["max_latency_ms"], 2),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    kind=APP_SETTINGS.get("PASSWORD_HASH_EXECUTOR", "thread"),
+    max_workers=APP_SETTINGS.get("PASSWORD_HASH_WORKERS", 0) or None,
+    max_queue=APP_SETTINGS.get("PASSWORD_HASH_QUEUE_SIZE", 64),
+)
 
 # ALGORITHM = "HS256"
 
@@ -28,19 +106,17 @@ def create_access_token(*, data: JWTPayload):
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     异步验证密码
-    使用 run_in_executor 避免阻塞 Event Loop
+    在专用的哈希执行器中运行, 避免阻塞 Event Loop
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, pwd_context.verify, plain_password, hashed_password)
+    return await password_hasher.run(verify_password_sync, plain_password, hashed_password)
 
 
 async def get_password_hash(password: str) -> str:
     """
     异步生成密码哈希
-    使用 run_in_executor 避免阻塞 Event Loop
+    在专用的哈希执行器中运行, 避免阻塞 Event Loop
     """
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, pwd_context.hash, password)
+    return await password_hasher.run(get_password_hash_sync, password)
 
 
 def verify_password_sync(plain_password: str, hashed_password: str) -> bool:
@@ -0,0 +1,108 @@
+"""
+中间件基准测试
+测量 make_middlewares() 中间件栈的单请求开销(相对不加中间件的应用), 不依赖数据库
+
+--baseline 指定提交时, 在该提交的临时 git worktree 中用同一脚本测量其中间件栈, 用于对比改动前后的开销,
+例如对比叠加中间件 (BackGroundTask + APILogger(BaseHTTPMiddleware) + APILoggerAddResponse)
+与纯 ASGI 的 RequestPipelineMiddleware
+
+用法: python benchmarks/bench_middlewares.py [-n 请求数] [--baseline 提交]
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent.resolve()
+
+
+async def bench(requests: int) -> dict[str, float]:
+    import httpx
+    from fastapi import FastAPI
+
+    from app.core import middlewares
+    from app.core.audit import AuditLogWriter
+    from app.core.init_app import make_middlewares
+
+    def create_bench_app(stack: list) -> FastAPI:
+        app = FastAPI(middleware=stack)
+
+        @app.get("/api/v1/bench/items")
+        async def list_items(size: int = 10):
+            return {"code": "0000", "data": {"records": [{"id": i, "name": f"item-{i}"} for i in range(size)]}}
+
+        @app.post("/api/v1/bench/items")
+        async def create_item(item: dict):
+            return {"code": "0000", "data": item}
+
+        return app
+
+    results = {}
+    for name, stack in (("none", []), ("stack", make_middlewares())):
+        # 日志只进入内存队列, 不写入数据库
+        middlewares.audit_log_writer = AuditLogWriter(max_queue=requests * 4)
+        transport = httpx.ASGITransport(app=create_bench_app(stack))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for _ in range(50):
+                await client.get("/api/v1/bench/items")
+
+            start = time.perf_counter()
+            for i in range(requests):
+                if i % 2:
+                    response = await client.post("/api/v1/bench/items", json={"name": "bench", "password": "secret"})
+                else:
+                    response = await client.get("/api/v1/bench/items", params={"size": 20})
+                response.raise_for_status()
+            results[name] = (time.perf_counter() - start) / requests * 1_000_000
+    return results
+
+
+def run_tree(tree: Path, requests: int, label: str) -> None:
+    """在 tree 目录下测量, 导入该目录中的 app"""
+    subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "-n", str(requests), "--tree", str(tree), "--label", label],
+        cwd=tree,
+        check=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="请求数")
+    parser.add_argument("--baseline", help="对比的基准提交, 在临时 git worktree 中测量")
+    parser.add_argument("--tree", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--label", default="current", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.tree is not None:
+        sys.path.insert(0, str(args.tree))
+        results = asyncio.run(bench(args.requests))
+        print(
+            f"{args.label:<10} {args.requests} requests  none {results['none']:.1f} us/request  "
+            f"middlewares {results['stack']:.1f} us/request  overhead {results['stack'] - results['none']:.1f} us/request"
+        )
+        return
+
+    if args.baseline:
+        with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+            worktree = Path(tmp) / "baseline"
+            subprocess.run(
+                ["git", "-C", str(PROJECT_ROOT), "worktree", "add", "--detach", str(worktree), args.baseline],
+                check=True,
+                capture_output=True,
+            )
+            try:
+                run_tree(worktree, args.requests, args.baseline)
+            finally:
+                subprocess.run(
+                    ["git", "-C", str(PROJECT_ROOT), "worktree", "remove", "--force", str(worktree)], check=True
+                )
+    run_tree(PROJECT_ROOT, args.requests, "current")
+
+
+if __name__ == "__main__":
+    main()
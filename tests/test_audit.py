@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+from tortoise import Tortoise, timezone
+
+from app.core.audit import AuditLogWriter, AuditSpool
+from app.models.system import APILog, Log, LogType
+
+
+def run(coro):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models.system"]})
+        await Tortoise.generate_schemas()
+        try:
+            return await coro()
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+def batch(x_request_id: str):
+    now = timezone.now()
+    api_logs = [{"x_request_id": x_request_id, "request_domain": "test", "request_path": "/api", "create_time": now}]
+    logs = [
+        {
+            "log_type": LogType.ApiLog,
+            "x_request_id": x_request_id,
+            "api_log_x_request_id": x_request_id,
+            "create_time": now,
+        }
+    ]
+    return api_logs, logs
+
+
+def test_spool_file_io_runs_off_event_loop(tmp_path):
+    async def case():
+        spool = AuditSpool(tmp_path, max_bytes=1024 * 1024)
+        threads = set()
+        for name in ("_open", "_append", "_lock_segment", "_remove_segment"):
+            func = getattr(spool, name)
+
+            def traced(*args, _func=func):
+                threads.add(threading.current_thread().name)
+                return _func(*args)
+
+            setattr(spool, name, traced)
+
+        writer = AuditLogWriter(spool=spool)
+        assert await spool.append(*batch("r1"))
+        assert await spool.append(*batch("r2"))
+
+        assert await writer.drain_spool() == 4
+        assert threads and all(name.startswith("audit-spool") for name in threads)
+        assert await APILog.all().count() == 2
+        assert await Log.filter(api_log_id__isnull=False).count() == 2
+        assert not list(tmp_path.iterdir())
+        assert spool.get_stats()["pending_bytes"] == 0
+
+    run(case)
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Any
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware import Middleware
+
+from app.core import middlewares
+from app.core.audit import APILogSampler
+from app.core.middlewares import RequestPipelineMiddleware
+from app.models.system import LogType
+
+# 被 RequestPipelineMiddleware 取代前 APILoggerMiddleware + APILoggerAddResponseMiddleware 记录的字段
+LEGACY_API_LOG_FIELDS = {
+    "ip_address",
+    "user_agent",
+    "request_domain",
+    "request_path",
+    "request_params",
+    "request_data",
+    "x_request_id",
+    "response_code",
+    "response_data",
+    "process_time",
+}
+
+
+class CaptureWriter:
+    """只记录放入队列的日志, 不写入数据库"""
+
+    def __init__(self):
+        self.logs: list[tuple[dict[str, Any], dict[str, Any]]] = []
+
+    async def add_api_log(self, api_log_data: dict[str, Any], log_data: dict[str, Any]) -> bool:
+        self.logs.append((api_log_data, log_data))
+        return True
+
+
+def request(method: str, path: str, **kwargs) -> tuple[httpx.Response, CaptureWriter]:
+    app = FastAPI(middleware=[Middleware(RequestPipelineMiddleware)])
+
+    @app.get("/api/v1/items/{item_id}")
+    async def get_item(item_id: int, size: int = 10):
+        return {"code": "0000", "data": {"id": item_id, "size": size}}
+
+    @app.post("/api/v1/items")
+    async def create_item(item: dict):
+        return {"code": "4090", "msg": "exists", "token": "secret"}
+
+    async def send():
+        transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await client.request(method, path, headers={"user-agent": "pytest"}, **kwargs)
+
+    writer = CaptureWriter()
+    saved = middlewares.audit_log_writer, middlewares.api_log_sampler, middlewares.api_rollup_writer.enabled
+    middlewares.audit_log_writer, middlewares.api_log_sampler = writer, APILogSampler()
+    middlewares.api_rollup_writer.enabled = False
+    try:
+        return asyncio.run(send()), writer
+    finally:
+        middlewares.audit_log_writer, middlewares.api_log_sampler, middlewares.api_rollup_writer.enabled = saved
+
+
+def test_pipeline_logs_legacy_fields_for_get():
+    response, writer = request("GET", "/api/v1/items/5", params={"size": "3"})
+
+    assert len(writer.logs) == 1
+    api_log, log_data = writer.logs[0]
+    assert LEGACY_API_LOG_FIELDS <= api_log.keys()
+    x_request_id = response.headers["x-request-id"]
+    assert {field: api_log[field] for field in LEGACY_API_LOG_FIELDS - {"process_time"}} == {
+        "ip_address": "10.0.0.1",
+        "user_agent": "pytest",
+        "request_domain": "testserver",
+        "request_path": "/api/v1/items/5",
+        "request_params": {"size": "3"},
+        "request_data": None,
+        "x_request_id": x_request_id,
+        "response_code": "0000",
+        "response_data": {"code": "0000", "data": {"id": 5, "size": 3}},
+    }
+    assert api_log["process_time"] >= 0
+    assert log_data == {"log_type": LogType.ApiLog, "by_user_id": None, "x_request_id": x_request_id}
+
+
+def test_pipeline_logs_legacy_fields_for_post():
+    response, writer = request("POST", "/api/v1/items", json={"name": "a", "password": "secret"})
+
+    api_log, log_data = writer.logs[0]
+    assert LEGACY_API_LOG_FIELDS <= api_log.keys()
+    assert api_log["request_params"] is None
+    assert api_log["request_data"] == {"name": "a", "password": "***"}
+    assert api_log["response_code"] == "4090"
+    assert api_log["response_data"] == {"code": "4090", "msg": "exists", "token": "***"}
+    assert log_data["x_request_id"] == api_log["x_request_id"] == response.headers["x-request-id"]
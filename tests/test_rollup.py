@@ -0,0 +1,90 @@
+import asyncio
+
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+
+from app.core.rollup import APIRollupWriter
+from app.models.system import APIRollup
+
+
+def run(coro):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.models.system"]})
+        await Tortoise.generate_schemas()
+        try:
+            return await coro()
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+def deadlock_on(writer: APIRollupWriter, attempts: set[int]):
+    """模拟并发写入同一汇总键时的 InnoDB 死锁, 第 attempts 次写入失败"""
+    write, calls = writer._write, []
+
+    async def _write(pending):
+        calls.append(len(pending))
+        if len(calls) in attempts:
+            raise OperationalError("(1213, 'Deadlock found when trying to get lock; try restarting transaction')")
+        await write(pending)
+
+    writer._write = _write
+    return calls
+
+
+def test_flush_retries_deadlock():
+    async def case():
+        writer = APIRollupWriter()
+        calls = deadlock_on(writer, {1})
+        for _ in range(3):
+            writer.record("GET", "/api/v1/users/{user_id}", "0000", 200, 0.01)
+
+        assert await writer.flush() == 1
+        assert len(calls) == 2
+        assert await APIRollup.all().values_list("request_count", flat=True) == [3]
+        assert writer.stats["discarded"] == 0
+
+    run(case)
+
+
+def test_flush_requeues_repeated_deadlock():
+    async def case():
+        writer = APIRollupWriter()
+        deadlock_on(writer, {1, 2})
+        writer.record("GET", "/api/v1/users/{user_id}", "0000", 200, 0.01)
+
+        assert await writer.flush() == 0
+        assert writer.get_stats()["pending"] == 1
+        writer.record("GET", "/api/v1/users/{user_id}", "0000", 200, 0.01)
+
+        assert await writer.flush() >= 1
+        assert sum(await APIRollup.all().values_list("request_count", flat=True)) == 2
+        assert writer.stats["discarded"] == 0
+
+    run(case)
+
+
+def test_flush_discards_data_error():
+    async def case():
+        writer = APIRollupWriter()
+
+        async def _write(pending):
+            raise ValueError("bad row")
+
+        writer._write = _write
+        writer.record("GET", "/api/v1/users/{user_id}", "0000", 200, 0.01)
+
+        assert await writer.flush() == 0
+        assert writer.get_stats()["pending"] == 0
+        assert writer.stats["discarded"] == 1
+
+    run(case)
+
+
+def test_record_normalizes_unknown_codes():
+    writer = APIRollupWriter()
+    for code in ("0000", "4001", "-1", "x" * 300):
+        writer.record("GET", "/api/v1/users/{user_id}", code, 200, 0.01)
+
+    assert sorted(key[3] for key in writer._pending) == ["-1", "0000", "4001", "other"]